@@ -0,0 +1,140 @@
+##
+##  MS3D Joint Animation
+##
+##  Copyright 2023 Edward Blake
+##
+##  See the file "LICENSE" for information on usage and redistribution
+##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
+##
+
+import math
+from array import array
+from bisect import bisect_right
+
+##
+## Samples the key frames of all joints of a MS3DFile. Each joint keeps
+## its rotation and position keys as sorted time arrays next to flat value
+## arrays, rotations are converted to quaternions once so that a sample
+## is a bisect and a slerp per joint.
+##
+## A pose is a tuple with a (rotation, position) pair per joint, the
+## rotation as a quaternion (x, y, z, w) relative to the joint's rest
+## rotation and the position relative to the rest position. Only the
+## last pose sampled is kept, for callers asking for the same time
+## again, so baking a long animation does not hold on to every frame.
+##
+class MS3DAnimSampler:
+	def __init__(self, ms3df):
+		(animation_fps, current_time, total_frames) = ms3df.anim
+		self.fps = animation_fps
+		self.total_frames = total_frames
+		self.tracks = []
+		for j in ms3df.joints:
+			rot_times = array('d')
+			rot_vals = array('d')
+			for (time, r_x, r_y, r_z) in sorted(j.key_frames_rot):
+				rot_times.append(time)
+				rot_vals.extend(euler_to_quat((r_x, r_y, r_z)))
+			pos_times = array('d')
+			pos_vals = array('d')
+			for (time, p_x, p_y, p_z) in sorted(j.key_frames_pos):
+				pos_times.append(time)
+				pos_vals.extend((p_x, p_y, p_z))
+			self.tracks.append((rot_times, rot_vals, pos_times, pos_vals))
+		self.cache = None
+
+	def sample(self, t):
+		if self.cache != None and self.cache[0] == t:
+			return self.cache[1]
+		pose = []
+		for (rot_times, rot_vals, pos_times, pos_vals) in self.tracks:
+			rot = sample_rot(rot_times, rot_vals, t)
+			pos = sample_pos(pos_times, pos_vals, t)
+			pose.append((rot, pos))
+		pose = tuple(pose)
+		self.cache = (t, pose)
+		return pose
+
+	def sample_frame(self, frame):
+		if self.fps <= 0.0:
+			return self.sample(0.0)
+		return self.sample(frame / self.fps)
+
+	def bake(self, num_frames=None):
+		## Frames are numbered from 1 as in Milkshape
+		if num_frames == None:
+			num_frames = self.total_frames
+		poses = []
+		for frame in range(1, num_frames + 1):
+			poses.append(self.sample_frame(frame))
+		return poses
+
+	def clear_cache(self):
+		self.cache = None
+
+
+def sample_rot(times, vals, t):
+	num_keys = len(times)
+	if num_keys == 0:
+		return (0.0, 0.0, 0.0, 1.0)
+	i = bisect_right(times, t)
+	if i == 0:
+		return tuple(vals[0:4])
+	if i == num_keys:
+		return tuple(vals[(num_keys-1)*4:num_keys*4])
+	t0 = times[i-1]
+	t1 = times[i]
+	f = (t - t0) / (t1 - t0)
+	return quat_slerp(vals[(i-1)*4:i*4], vals[i*4:(i+1)*4], f)
+
+
+def sample_pos(times, vals, t):
+	num_keys = len(times)
+	if num_keys == 0:
+		return (0.0, 0.0, 0.0)
+	i = bisect_right(times, t)
+	if i == 0:
+		return tuple(vals[0:3])
+	if i == num_keys:
+		return tuple(vals[(num_keys-1)*3:num_keys*3])
+	t0 = times[i-1]
+	t1 = times[i]
+	f = (t - t0) / (t1 - t0)
+	(x0, y0, z0) = vals[(i-1)*3:i*3]
+	(x1, y1, z1) = vals[i*3:(i+1)*3]
+	return (x0 + (x1 - x0) * f, y0 + (y1 - y0) * f, z0 + (z1 - z0) * f)
+
+
+## Milkshape euler angles in radians, applied x then y then z
+def euler_to_quat(angles):
+	(a_x, a_y, a_z) = angles
+	sy = math.sin(a_z * 0.5)
+	cy = math.cos(a_z * 0.5)
+	sp = math.sin(a_y * 0.5)
+	cp = math.cos(a_y * 0.5)
+	sr = math.sin(a_x * 0.5)
+	cr = math.cos(a_x * 0.5)
+	return (sr*cp*cy - cr*sp*sy,
+		cr*sp*cy + sr*cp*sy,
+		cr*cp*sy - sr*sp*cy,
+		cr*cp*cy + sr*sp*sy)
+
+
+def quat_slerp(q0, q1, f):
+	(x0, y0, z0, w0) = q0
+	(x1, y1, z1, w1) = q1
+	cosom = x0*x1 + y0*y1 + z0*z1 + w0*w1
+	## Take the shorter way around
+	if cosom < 0.0:
+		cosom = -cosom
+		(x1, y1, z1, w1) = (-x1, -y1, -z1, -w1)
+	if cosom < 0.9999:
+		omega = math.acos(cosom)
+		sinom = math.sin(omega)
+		s0 = math.sin((1.0 - f) * omega) / sinom
+		s1 = math.sin(f * omega) / sinom
+	else:
+		## Nearly the same rotation, linear is close enough
+		s0 = 1.0 - f
+		s1 = f
+	return (s0*x0 + s1*x1, s0*y0 + s1*y1, s0*z0 + s1*z1, s0*w0 + s1*w1)
@@ -0,0 +1,122 @@
+##
+##  Parse cache for Milkshape 3D files
+##
+##  Copyright 2023 Edward Blake
+##
+##  See the file "LICENSE" for information on usage and redistribution
+##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
+##
+
+import os
+import hashlib
+from os import path
+
+from ms3d import ms3d_import
+from ms3d.ms3d_pack import PACK_VERSION, pack_ms3d_file, unpack_ms3d_file
+
+CACHE_SUFFIX = ".ms3dpack"
+
+##
+## Keeps packed snapshots of parsed files in a directory. An entry is
+## found again by the absolute path, size and modification time of the
+## source file and the reader version, the least recently used entries
+## are removed once the directory grows over max_bytes.
+##
+## The entries and their sizes are kept in memory in order of use, the
+## directory is only scanned when the cache is made. Entries other
+## processes add in the meantime are only counted once loaded.
+##
+class MS3DCache:
+	def __init__(self, cache_dir, max_bytes=256*1024*1024):
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		os.makedirs(cache_dir, exist_ok=True)
+		## Entry file name to size, least recently used first
+		self.sizes = {}
+		self.total_bytes = 0
+		ents = self.entries()
+		ents.sort()
+		for (mtime, size, flname) in ents:
+			self.add_entry(flname, size)
+
+	def key(self, flname, sections):
+		flname = path.abspath(flname)
+		st = os.stat(flname)
+		keystr = repr((flname, st.st_size, st.st_mtime_ns, ms3d_import.READER_VERSION, PACK_VERSION, sections))
+		return hashlib.sha1(keystr.encode("utf-8")).hexdigest()
+
+	def read_ms3d_file(self, flname, sections=ms3d_import.READ_ALL):
+		cache_flname = path.join(self.cache_dir, self.key(flname, sections) + CACHE_SUFFIX)
+		ms3df = self.load(cache_flname)
+		if ms3df != None:
+			self.hits = self.hits + 1
+			return ms3df
+
+		self.misses = self.misses + 1
+		ms3df = ms3d_import.read_ms3d_file(flname, sections=sections)
+		self.store(cache_flname, pack_ms3d_file(ms3df))
+		return ms3df
+
+	def load(self, cache_flname):
+		try:
+			fp = open(cache_flname, "rb")
+			data = fp.read()
+			fp.close()
+		except OSError:
+			return None
+		try:
+			ms3df = unpack_ms3d_file(data)
+		except (ValueError, EOFError, TypeError):
+			## Corrupt or from another version, it would fail again on
+			## every later load
+			self.remove_entry(cache_flname)
+			return None
+		## Mark as recently used
+		os.utime(cache_flname)
+		self.add_entry(cache_flname, len(data))
+		return ms3df
+
+	def store(self, cache_flname, data):
+		tmp_flname = cache_flname + ".tmp"
+		fp = open(tmp_flname, "wb")
+		fp.write(data)
+		fp.close()
+		os.replace(tmp_flname, cache_flname)
+		self.add_entry(cache_flname, len(data))
+		self.evict()
+
+	## Adds an entry or moves it to the most recently used end
+	def add_entry(self, flname, size):
+		self.total_bytes = self.total_bytes - self.sizes.pop(flname, 0) + size
+		self.sizes[flname] = size
+
+	def remove_entry(self, flname):
+		try:
+			os.remove(flname)
+		except OSError:
+			pass
+		self.total_bytes = self.total_bytes - self.sizes.pop(flname, 0)
+
+	def entries(self):
+		ents = []
+		for nm in os.listdir(self.cache_dir):
+			if nm.endswith(CACHE_SUFFIX):
+				flname = path.join(self.cache_dir, nm)
+				try:
+					st = os.stat(flname)
+				except OSError:
+					continue
+				ents.append((st.st_mtime_ns, st.st_size, flname))
+		return ents
+
+	def evict(self):
+		while self.total_bytes > self.max_bytes and len(self.sizes) > 0:
+			self.remove_entry(next(iter(self.sizes)))
+			self.evictions = self.evictions + 1
+
+	def stats(self):
+		return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+			"entries": len(self.sizes), "bytes": self.total_bytes}
@@ -8,7 +8,25 @@
 ##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
 ##
 
+import sys
+from math import isfinite
+from array import array
+from itertools import chain
+from operator import attrgetter
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+## Same as READER_DIRTY and WRITER_DIRTY, groups with it are always
+## converted again by an incremental MeshHelper
+MESH_DIRTY = 8
+
 class MS3DFile:
+	__slots__ = ("vertices", "triangles", "groups", "materials", "anim", "joints", "comments", "extra")
+	
 	def __init__(self):
 		self.vertices = []
 		self.triangles = []
@@ -20,20 +38,267 @@ class MS3DFile:
 		self.extra = None
 		
 	def update_ref_counts(self):
-		for i in range(0, len(self.vertices)):
-			self.vertices[i].ref_count = 0
-			
-		for t in self.triangles:
-			self.vertices[t.v_1].ref_count = self.vertices[t.v_1].ref_count + 1
-			self.vertices[t.v_2].ref_count = self.vertices[t.v_2].ref_count + 1
-			self.vertices[t.v_3].ref_count = self.vertices[t.v_3].ref_count + 1
+		## All corners are counted in one go
+		corners = chain.from_iterable(map(attrgetter("v_1", "v_2", "v_3"), self.triangles))
+		counts = index_counts(corners, len(self.vertices))
+		for (v, count) in zip(self.vertices, counts):
+			v.ref_count = count
 		
+		triangles = self.triangles
 		for i in range(0, len(self.groups)):
 			for tidx in self.groups[i].triangles:
-				self.triangles[tidx].g_idx = i
+				triangles[tidx].g_idx = i
+
+
+##
+## Per file summary returned by read_ms3d_index
+##
+class MS3DIndex:
+	__slots__ = ("num_vertices", "num_triangles", "num_groups", "num_joints", "group_names", "material_names", "texture_names", "animation_fps", "total_frames", "bounds")
+	
+	def __init__(self):
+		self.num_vertices = 0
+		self.num_triangles = 0
+		self.num_groups = 0
+		self.num_joints = 0
+		self.group_names = []
+		self.material_names = []
+		self.texture_names = []
+		self.animation_fps = 0.0
+		self.total_frames = 0
+		self.bounds = None  ## ((min_x, min_y, min_z), (max_x, max_y, max_z))
+
+
+##
+## Vertex and triangle data held in arrays, one entry or row per
+## vertex or triangle.
+##
+class MS3DArrayFile:
+	__slots__ = ("vertex_flags", "positions", "bone_ids", "ref_counts", "triangle_flags", "indices", "normals", "uvs", "sgs", "g_idxs", "groups", "materials", "anim", "joints", "comments", "extra")
+	
+	def __init__(self):
+		self.vertex_flags = None    ## (N,)
+		self.positions = None       ## (N,3) x, y, z
+		self.bone_ids = None        ## (N,)
+		self.ref_counts = None      ## (N,)
+		self.triangle_flags = None  ## (T,)
+		self.indices = None         ## (T,3) vertex indices
+		self.normals = None         ## (T,3,3) normal per corner
+		self.uvs = None             ## (T,3,2) uv per corner
+		self.sgs = None             ## (T,) smoothing group
+		self.g_idxs = None          ## (T,) group index
+		self.groups = []
+		self.materials = []
+		self.anim = (0, 0, 0)
+		self.joints = []
+		self.comments = MS3DFileComments()
+		self.extra = (None, None, None)
+	
+	def update_ref_counts(self):
+		counts = numpy.bincount(self.indices.ravel(), minlength=len(self.positions))
+		self.ref_counts = numpy.minimum(counts, 255).astype(numpy.uint8)
+		self.g_idxs = scatter_group_indices(self.groups, self.g_idxs)
+	
+	def bounds(self):
+		if len(self.positions) == 0:
+			return None
+		return (tuple(self.positions.min(axis=0).tolist()), tuple(self.positions.max(axis=0).tolist()))
+
+
+##
+## Vertex and triangle data held in array.array columns, works without
+## numpy. Positions have 3 entries per vertex, triangle indices 3,
+## normals 9 and uvs 6 (u1, u2, u3 then v1, v2, v3) per triangle.
+##
+class MS3DColumnFile:
+	__slots__ = ("vertex_flags", "positions", "bone_ids", "ref_counts", "triangle_flags", "indices", "normals", "uvs", "sgs", "g_idxs", "groups", "materials", "anim", "joints", "comments", "extra")
+	
+	def __init__(self):
+		self.vertex_flags = array('B')
+		self.positions = array('f')
+		self.bone_ids = array('b')
+		self.ref_counts = array('B')
+		self.triangle_flags = array('H')
+		self.indices = array('H')
+		self.normals = array('f')
+		self.uvs = array('f')
+		self.sgs = array('B')
+		self.g_idxs = array('B')
+		self.groups = []
+		self.materials = []
+		self.anim = (0, 0, 0)
+		self.joints = []
+		self.comments = None
+		self.extra = None
+	
+	def num_vertices(self):
+		return len(self.vertex_flags)
+	
+	def num_triangles(self):
+		return len(self.triangle_flags)
+	
+	def update_ref_counts(self):
+		counts = index_counts(self.indices, len(self.vertex_flags))
+		self.ref_counts = array('B', [min(c, 255) for c in counts])
+		self.g_idxs = scatter_group_indices(self.groups, self.g_idxs)
+	
+	def group_triangles(self, gidx):
+		return [i for i in range(0, len(self.g_idxs)) if self.g_idxs[i] == gidx]
+	
+	## Vertex and triangle sections as they are in a .ms3d file
+	def vertex_data(self):
+		return interleave(15, len(self.vertex_flags), [
+			(0, self.vertex_flags),
+			(1, self.positions),
+			(13, self.bone_ids),
+			(14, self.ref_counts)])
+	
+	def triangle_data(self):
+		return interleave(70, len(self.triangle_flags), [
+			(0, self.triangle_flags),
+			(2, self.indices),
+			(8, self.normals),
+			(44, self.uvs),
+			(68, self.sgs),
+			(69, self.g_idxs)])
+	
+	def set_vertex_data(self, data, num_vertices):
+		(self.vertex_flags, self.positions, self.bone_ids, self.ref_counts) = deinterleave(data, 15, num_vertices, [
+			(0, 'B', 1), (1, 'f', 3), (13, 'b', 1), (14, 'B', 1)])
+	
+	def set_triangle_data(self, data, num_triangles):
+		(self.triangle_flags, self.indices, self.normals, self.uvs, self.sgs, self.g_idxs) = deinterleave(data, 70, num_triangles, [
+			(0, 'H', 1), (2, 'H', 3), (8, 'f', 9), (44, 'f', 6), (68, 'B', 1), (69, 'B', 1)])
+	
+	def from_ms3d_file(self, ms3df):
+		for v in ms3df.vertices:
+			self.vertex_flags.append(v.flags)
+			self.positions.extend((v.v_x, v.v_y, v.v_z))
+			self.bone_ids.append(v.bone_id)
+			self.ref_counts.append(v.ref_count)
+		for t in ms3df.triangles:
+			self.triangle_flags.append(t.flags)
+			self.indices.extend((t.v_1, t.v_2, t.v_3))
+			self.normals.extend(t.vn1 + t.vn2 + t.vn3)
+			self.uvs.extend((t.uv1[0], t.uv2[0], t.uv3[0], t.uv1[1], t.uv2[1], t.uv3[1]))
+			self.sgs.append(t.sg)
+			self.g_idxs.append(t.g_idx)
+		self.groups = ms3df.groups
+		self.materials = ms3df.materials
+		self.anim = ms3df.anim
+		self.joints = ms3df.joints
+		self.comments = ms3df.comments
+		self.extra = ms3df.extra
+	
+	def to_ms3d_file(self):
+		ms3df = MS3DFile()
+		pos = self.positions
+		for i in range(0, len(self.vertex_flags)):
+			v = MS3DVertex()
+			v.flags = self.vertex_flags[i]
+			(v.v_x, v.v_y, v.v_z) = pos[i*3:i*3+3]
+			v.bone_id = self.bone_ids[i]
+			v.ref_count = self.ref_counts[i]
+			ms3df.vertices.append(v)
+		for i in range(0, len(self.triangle_flags)):
+			t = MS3DTriangle()
+			t.flags = self.triangle_flags[i]
+			(t.v_1, t.v_2, t.v_3) = self.indices[i*3:i*3+3]
+			vn = self.normals[i*9:i*9+9]
+			t.vn1 = (vn[0], vn[1], vn[2])
+			t.vn2 = (vn[3], vn[4], vn[5])
+			t.vn3 = (vn[6], vn[7], vn[8])
+			uv = self.uvs[i*6:i*6+6]
+			t.uv1 = (uv[0], uv[3])
+			t.uv2 = (uv[1], uv[4])
+			t.uv3 = (uv[2], uv[5])
+			t.sg = self.sgs[i]
+			t.g_idx = self.g_idxs[i]
+			ms3df.triangles.append(t)
+		ms3df.groups = self.groups
+		ms3df.materials = self.materials
+		ms3df.anim = self.anim
+		ms3df.joints = self.joints
+		ms3df.comments = self.comments
+		ms3df.extra = self.extra
+		return ms3df
+
+##
+## Number of uses of each vertex index, a bincount over the flat
+## sequence of triangle corners
+##
+def index_counts(indices, num_vertices):
+	if numpy != None:
+		if isinstance(indices, array):
+			idx = numpy.frombuffer(indices, dtype=indices.typecode)
+		else:
+			idx = numpy.fromiter(indices, dtype=numpy.intp)
+		return numpy.bincount(idx, minlength=num_vertices).tolist()
+	counts = [0] * num_vertices
+	for i in indices:
+		counts[i] = counts[i] + 1
+	return counts
+
+##
+## Copy of a g_idx column with the index of each group written to its
+## triangles, one fancy indexed store per group with numpy
+##
+def scatter_group_indices(groups, g_idxs):
+	if numpy != None:
+		if isinstance(g_idxs, array):
+			out = numpy.array(g_idxs, dtype=g_idxs.typecode)
+		else:
+			out = numpy.array(g_idxs)
+		for i in range(0, len(groups)):
+			out[groups[i].triangles] = i
+		if isinstance(g_idxs, array):
+			return array(g_idxs.typecode, out.tobytes())
+		return out
+	out = array(g_idxs.typecode, g_idxs)
+	for i in range(0, len(groups)):
+		for tidx in groups[i].triangles:
+			out[tidx] = i
+	return out
+
+##
+## Records of size bytes are put together from columns with strided
+## slice assignment, one slice per byte of a field instead of packing
+## each record. fields are (offset, column) pairs, a column holds the
+## same number of values for every record. Records are little endian.
+##
+def interleave(size, num, fields):
+	data = bytearray(size * num)
+	if num == 0:
+		return data
+	for (offset, col) in fields:
+		if sys.byteorder == "big" and col.itemsize > 1:
+			col = array(col.typecode, col)
+			col.byteswap()
+		colbytes = col.tobytes()
+		width = len(colbytes) // num
+		for k in range(0, width):
+			data[offset+k::size] = colbytes[k::width]
+	return data
+
+## fields are (offset, typecode, count) with count values per record
+def deinterleave(data, size, num, fields):
+	cols = []
+	for (offset, typecode, count) in fields:
+		col = array(typecode)
+		width = col.itemsize * count
+		colbytes = bytearray(width * num)
+		for k in range(0, width):
+			colbytes[k::width] = data[offset+k:size*num:size]
+		col.frombytes(colbytes)
+		if sys.byteorder == "big" and col.itemsize > 1:
+			col.byteswap()
+		cols.append(col)
+	return cols
 
 
 class MS3DVertex:
+	__slots__ = ("flags", "v_x", "v_y", "v_z", "bone_id", "ref_count")
+	
 	def __init__(self):
 		self.flags = 0
 		self.v_x = 0.0
@@ -43,6 +308,8 @@ class MS3DVertex:
 		self.ref_count = 0
 
 class MS3DTriangle:
+	__slots__ = ("flags", "v_1", "v_2", "v_3", "vn1", "vn2", "vn3", "uv1", "uv2", "uv3", "sg", "g_idx")
+	
 	def __init__(self):
 		self.flags = 0
 		self.v_1 = 0
@@ -58,6 +325,8 @@ class MS3DTriangle:
 		self.g_idx = 0
 
 class MS3DGroup:
+	__slots__ = ("flags", "name", "triangles", "mat_index")
+	
 	def __init__(self):
 		self.flags = 0
 		self.name = ""
@@ -65,6 +334,8 @@ class MS3DGroup:
 		self.mat_index = -1
 
 class MS3DMaterial:
+	__slots__ = ("name", "ambient", "diffuse", "specular", "emissive", "shininess", "transparency", "mode", "imagemap", "alphamap")
+	
 	def __init__(self):
 		self.name = ""
 		self.ambient = (0.0, 0.0, 0.0, 0.0)
@@ -78,6 +349,8 @@ class MS3DMaterial:
 		self.alphamap = ""
 
 class MS3DJoint:
+	__slots__ = ("flags", "jointname", "parentname", "rot", "pos", "key_frames_rot", "key_frames_pos")
+	
 	def __init__(self):
 		self.flags = 0
 		self.jointname = ""
@@ -88,6 +361,8 @@ class MS3DJoint:
 		self.key_frames_pos = []
 
 class MS3DFileComments:
+	__slots__ = ("group_comments", "material_comments", "joint_comments", "model_comment")
+	
 	def __init__(self):
 		self.group_comments = []
 		self.material_comments = []
@@ -95,6 +370,8 @@ class MS3DFileComments:
 		self.model_comment = []
 
 class MS3DVertex_ex:
+	__slots__ = ("bone_id1", "bone_id2", "bone_id3", "weight1", "weight2", "weight3", "extra1", "extra2")
+	
 	def __init__(self):
 		self.bone_id1 = -1
 		self.bone_id2 = -1
@@ -106,18 +383,24 @@ class MS3DVertex_ex:
 		self.extra2 = 0
 
 class MS3DJoint_ex:
+	__slots__ = ("col_r", "col_g", "col_b")
+	
 	def __init__(self):
 		self.col_r = 0.0
 		self.col_g = 0.0
 		self.col_b = 0.0
 
 class MS3DModel_ex:
+	__slots__ = ("jointsize", "transparencymode", "alpharef")
+	
 	def __init__(self):
 		self.jointsize = 0.0
 		self.transparencymode = 0
 		self.alpharef = 0.0
 		
 class Mesh:
+	__slots__ = ("meshname", "meshflags", "materialindex", "vertices", "normals", "trianglefaces")
+	
 	def __init__(self):
 		self.meshname = ""
 		self.meshflags = 0
@@ -125,159 +408,478 @@ class Mesh:
 		self.vertices = []
 		self.normals = []
 		self.trianglefaces = []
+	
+	def drop_unused_vertices(self):
+		## Remove vertices no triangle refers to, keeping the order of
+		## the others
+		used = set()
+		for (flags, v1, v2, v3, n1, n2, n3, sg) in self.trianglefaces:
+			used.add(v1)
+			used.add(v2)
+			used.add(v3)
+		if len(used) == len(self.vertices):
+			return
+		nv = {}
+		vertices = []
+		for i in range(0, len(self.vertices)):
+			if i in used:
+				nv[i] = len(vertices)
+				vertices.append(self.vertices[i])
+		self.vertices = vertices
+		self.trianglefaces = [(flags, nv[v1], nv[v2], nv[v3], n1, n2, n3, sg)
+			for (flags, v1, v2, v3, n1, n2, n3, sg) in self.trianglefaces]
 		
+## The parts of a triangle and a vertex that get() reads
+TRIANGLE_KEY = attrgetter("flags", "v_1", "v_2", "v_3", "vn1", "vn2", "vn3", "uv1", "uv2", "uv3", "sg")
+VERTEX_KEY = attrgetter("flags", "v_x", "v_y", "v_z", "bone_id")
+
 def list_triple(a):
 	return (a[0], a[1], a[2])
 		
 class MeshHelper:
-	def __init__(self):
+	__slots__ = ("meshes", "normal_bits", "incremental", "get_cache", "set_cache")
+	
+	## With normal_bits set, get() merges normals that are the same
+	## when quantized to that many bits per component.
+	## With incremental set, the results of get() and set() are kept per
+	## group and used again by the next call for groups that are unchanged
+	## and do not have the MESH_DIRTY flag. In that mode get() replaces
+	## meshes with the meshes of the file it is given, instead of adding
+	## them to the ones already there. The reused Mesh, MS3DGroup,
+	## MS3DVertex and MS3DTriangle objects are shared between the results,
+	## so they should not be changed in place.
+	def __init__(self, normal_bits=None, incremental=False):
 		self.meshes = []
+		self.normal_bits = normal_bits
+		self.incremental = incremental
+		self.get_cache = []
+		self.set_cache = []
 	
+	## There is no parallel set(), making the MS3DVertex and MS3DTriangle
+	## objects is most of its work and that has to happen in this process.
+	## set_columns() has one.
 	def set(self, m):
+		cache = self.set_cache
+		self.set_cache = []
 		gidx = 0
 		for mesh in self.meshes:
+			voffset = len(m.vertices)
+			toffset = len(m.triangles)
+			if not self.incremental:
+				m.groups.append(self.set_group(m, mesh, gidx))
+				gidx = gidx + 1
+				continue
 			
-			meshname_0 = mesh.meshname
-			flags_0 = mesh.meshflags
-			materialindex_0 = mesh.materialindex
-			vertices_0 = mesh.vertices
-			normals_0 = mesh.normals
-			trianglefaces_0 = mesh.trianglefaces
-			
-			g = MS3DGroup()
-			g.flags = flags_0
-			g.name = meshname_0
-			g.mat_index = materialindex_0
+			## Mesh rows are tuples, so comparing them with the rows of the
+			## last call mostly comes down to identity checks
+			key = (mesh.meshname, mesh.meshflags, mesh.materialindex,
+				tuple(mesh.vertices), tuple(mesh.normals), tuple(mesh.trianglefaces))
+			entry = None
+			if gidx < len(cache) and not (mesh.meshflags & MESH_DIRTY):
+				entry = cache[gidx]
+				if entry[1] != voffset or entry[2] != toffset or entry[0] != key:
+					entry = None
+			if entry == None:
+				g = self.set_group(m, mesh, gidx)
+				entry = (key, voffset, toffset, g, m.vertices[voffset:], m.triangles[toffset:])
+			else:
+				m.vertices.extend(entry[4])
+				m.triangles.extend(entry[5])
+			m.groups.append(entry[3])
+			self.set_cache.append(entry)
+			gidx = gidx + 1
+		m.update_ref_counts()
+	
+	def set_group(self, m, mesh, gidx):
+		meshname_0 = mesh.meshname
+		flags_0 = mesh.meshflags
+		materialindex_0 = mesh.materialindex
+		vertices_0 = mesh.vertices
+		normals_0 = mesh.normals
+		trianglefaces_0 = mesh.trianglefaces
+		
+		g = MS3DGroup()
+		g.flags = flags_0
+		g.name = meshname_0
+		g.mat_index = materialindex_0
+		
+		nv = [] # Vertices
+		for v in vertices_0:
+			(flags, v_x, v_y, v_z, v_u, v_v, boneindex) = v
+			v = MS3DVertex()
+			v.flags = flags
+			v.v_x = v_x
+			v.v_y = v_y
+			v.v_z = v_z
+			v.bone_id = boneindex
+			nv.append(len(m.vertices))
+			m.vertices.append(v)
+		
+		g.triangles = []
+		for tri in trianglefaces_0:
+			(flags, idx1, idx2, idx3, nidx1, nidx2, nidx3, smoothinggroup) = tri
 			
-			nv = [] # Vertices
-			for v in vertices_0:
-				(flags, v_x, v_y, v_z, v_u, v_v, boneindex) = v
-				v = MS3DVertex()
-				v.flags = flags
-				v.v_x = v_x
-				v.v_y = v_y
-				v.v_z = v_z
-				v.bone_id = boneindex
-				nv.append(len(m.vertices))
-				m.vertices.append(v)
+			t = MS3DTriangle()
+			t.flags = flags
+			t.v_1 = nv[idx1]
+			t.v_2 = nv[idx2]
+			t.v_3 = nv[idx3]
+			t.vn1 = list_triple(normals_0[nidx1])
+			t.vn2 = list_triple(normals_0[nidx2])
+			t.vn3 = list_triple(normals_0[nidx3])
 			
-			g.triangles = []
-			for tri in trianglefaces_0:
-				(flags, idx1, idx2, idx3, nidx1, nidx2, nidx3, smoothinggroup) = tri
-				
-				t = MS3DTriangle()
-				t.flags = flags
-				t.v_1 = nv[idx1]
-				t.v_2 = nv[idx2]
-				t.v_3 = nv[idx3]
-				t.vn1 = list_triple(normals_0[nidx1])
-				t.vn2 = list_triple(normals_0[nidx2])
-				t.vn3 = list_triple(normals_0[nidx3])
-				
-				(_, _, _, _, v_u1, v_v1, _) = vertices_0[idx1]
-				(_, _, _, _, v_u2, v_v2, _) = vertices_0[idx2]
-				(_, _, _, _, v_u3, v_v3, _) = vertices_0[idx3]
-				t.uv1 = (v_u1,v_v1)
-				t.uv2 = (v_u2,v_v2)
-				t.uv3 = (v_u3,v_v3)
-
-				t.sg = smoothinggroup
-				t.g_idx = gidx
-				
-				tri_idx = len(m.triangles)
-				m.triangles.append(t)
-				
-				g.triangles.append(tri_idx)
+			(_, _, _, _, v_u1, v_v1, _) = vertices_0[idx1]
+			(_, _, _, _, v_u2, v_v2, _) = vertices_0[idx2]
+			(_, _, _, _, v_u3, v_v3, _) = vertices_0[idx3]
+			t.uv1 = (v_u1,v_v1)
+			t.uv2 = (v_u2,v_v2)
+			t.uv3 = (v_u3,v_v3)
+
+			t.sg = smoothinggroup
+			t.g_idx = gidx
 			
-			m.groups.append(g)
-			gidx = gidx + 1
-		m.update_ref_counts()
+			tri_idx = len(m.triangles)
+			m.triangles.append(t)
 			
-	def get(self, ms3df):
+			g.triangles.append(tri_idx)
+		
+		return g
+	
+	## With more than one worker, the groups that need converting are
+	## converted in a process pool of that many processes (see
+	## get_groups_parallel). mp_context picks the start method of its
+	## processes as for ProcessPoolExecutor, None is the default one.
+	def get(self, ms3df, workers=None, mp_context=None):
 		vertices_0 = ms3df.vertices
 		triangles_0 = ms3df.triangles
 		groups_0 = ms3df.groups
+		cache = self.get_cache
+		self.get_cache = []
 		
-		for g in groups_0:
-			triangles = g.triangles
-			
-			nv = {} ## Vertices
-			nn = {} ## Normals
-			
-			m = Mesh()
-			m.meshname = g.name
-			m.meshflags = g.flags
-			m.materialindex = g.mat_index
-			m.vertices = []
-			m.normals = []
-			m.trianglefaces = []
+		meshes = [None] * len(groups_0)
+		keys = [None] * len(groups_0)
+		if self.incremental:
+			for gi in range(0, len(groups_0)):
+				g = groups_0[gi]
+				## The rows are compared with the rows of the last call instead
+				## of hashed, the floats of unchanged rows are the same objects
+				## and tuple comparison checks identity first
+				keys[gi] = (g.name, g.flags, g.mat_index, self.normal_bits,
+					tuple(map(TRIANGLE_KEY, map(triangles_0.__getitem__, g.triangles))))
+				if gi < len(cache) and not (g.flags & MESH_DIRTY):
+					entry = cache[gi]
+					if entry[0] == keys[gi] and entry[2] < len(vertices_0) and entry[3] == tuple(map(VERTEX_KEY, map(vertices_0.__getitem__, entry[1]))):
+						meshes[gi] = entry
+		
+		todo = [gi for gi in range(0, len(groups_0)) if meshes[gi] == None]
+		vertex_rows = []
+		if len(todo) > 0:
+			vertex_rows = list(map(VERTEX_KEY, vertices_0))
+		if use_workers(workers):
+			results = get_groups_parallel(ms3df, todo, vertex_rows, self.normal_bits, workers, mp_context)
+		else:
+			results = [self.get_group(groups_0[gi], vertex_rows, triangles_0) for gi in todo]
+		for (gi, (m, vidx)) in zip(todo, results):
+			if self.incremental:
+				meshes[gi] = (keys[gi], vidx, max(vidx, default=-1), tuple(map(vertex_rows.__getitem__, vidx)), m)
+			else:
+				meshes[gi] = (None, None, None, None, m)
+		
+		if self.incremental:
+			self.meshes = [entry[4] for entry in meshes]
+			self.get_cache = meshes
+		else:
+			for entry in meshes:
+				self.meshes.append(entry[4])
+	
+	## Returns the Mesh of a group and the indices of the vertices it
+	## uses. The corners are welded by weld_group, or weld_group_numpy
+	## for large groups, as in get_columns().
+	def get_group(self, g, vertex_rows, triangles_0):
+		tris = list(map(triangles_0.__getitem__, g.triangles))
+		tri_flags = [tri.flags for tri in tris]
+		tri_sgs = [tri.sg for tri in tris]
+		corner_vs = [v_i for tri in tris for v_i in (tri.v_1, tri.v_2, tri.v_3)]
+		corner_uvs = [uv for tri in tris for uv in (tri.uv1, tri.uv2, tri.uv3)]
+		corner_vns = [vn for tri in tris for vn in (tri.vn1, tri.vn2, tri.vn3)]
+		if numpy != None and len(corner_vs) >= WELD_NUMPY_MIN_CORNERS:
+			m = weld_group_numpy(g, tri_flags, tri_sgs,
+				numpy.array(corner_vs, dtype=numpy.intp),
+				numpy.array(corner_uvs, dtype=numpy.float64),
+				numpy.array(corner_vns, dtype=numpy.float64),
+				vertex_rows, self.normal_bits)
+		else:
+			m = weld_group(g, tri_flags, tri_sgs, corner_vs, corner_uvs, corner_vns, vertex_rows, self.normal_bits)
+		## The vertex indices in the order they are first used
+		return (m, tuple(dict.fromkeys(corner_vs)))
+	
+	## set() and get() for a MS3DColumnFile, working on the columns
+	## directly. With more than one worker, set_columns() makes the
+	## columns of each mesh in a process pool of that many processes,
+	## started with mp_context as in get().
+	def set_columns(self, cf, workers=None, mp_context=None):
+		## Where the vertices of each mesh start is a prefix sum of the
+		## vertex counts, so every mesh can be done on its own
+		tasks = []
+		voffset = len(cf.vertex_flags)
+		for mi in range(0, len(self.meshes)):
+			tasks.append((mi, voffset, mi))
+			voffset = voffset + len(self.meshes[mi].vertices)
+		if use_workers(workers):
+			pool = worker_pool(workers, self.meshes, mp_context)
+			parts = pool.map(mesh_columns_task, tasks)
+		else:
+			parts = [mesh_columns(self.meshes[mi], voffset, gidx) for (mi, voffset, gidx) in tasks]
+		
+		for (mesh, part) in zip(self.meshes, parts):
+			g = MS3DGroup()
+			g.flags = mesh.meshflags
+			g.name = mesh.meshname
+			g.mat_index = mesh.materialindex
 			
-			for tri_idx in triangles:
-				tri = triangles_0[tri_idx]
-				
-				flags = tri.flags
-				v_1 = tri.v_1
-				v_2 = tri.v_2
-				v_3 = tri.v_3
-				vn1 = tri.vn1
-				vn2 = tri.vn2
-				vn3 = tri.vn3
-				uv1 = tri.uv1
-				uv2 = tri.uv2
-				uv3 = tri.uv3
-				sg = tri.sg
-				g_idx = tri.g_idx
-				
-				if v_1 in nv:
-					v1 = nv[v_1]
-				else:
-					v = vertices_0[v_1]
-					nv[v_1] = len(m.vertices)
-					v1 = nv[v_1]
-					(uvu1,uvv1) = uv1
-					m.vertices.append((v.flags, v.v_x,v.v_y,v.v_z, uvu1,uvv1, v.bone_id))
-				
-				if v_2 in nv:
-					v2 = nv[v_2]
-				else:
-					v = vertices_0[v_2]
-					nv[v_2] = len(m.vertices)
-					v2 = nv[v_2]
-					(uvu2,uvv2) = uv2
-					m.vertices.append((v.flags, v.v_x,v.v_y,v.v_z, uvu2,uvv2, v.bone_id))
-				
-				if v_3 in nv:
-					v3 = nv[v_3]
-				else:
-					v = vertices_0[v_3]
-					nv[v_3] = len(m.vertices)
-					v3 = nv[v_3]
-					(uvu3,uvv3) = uv3
-					m.vertices.append((v.flags, v.v_x,v.v_y,v.v_z, uvu3,uvv3, v.bone_id))
-				
-				if vn1 in nn:
-					n1 = nn[vn1]
-				else:
-					nn[vn1] = len(m.normals)
-					n1 = nn[vn1]
-					m.normals.append(vn1)
-				
-				if vn2 in nn:
-					n2 = nn[vn2]
-				else:
-					nn[vn2] = len(m.normals)
-					n2 = nn[vn2]
-					m.normals.append(vn2)
-				
-				if vn3 in nn:
-					n3 = nn[vn3]
-				else:
-					nn[vn3] = len(m.normals)
-					n3 = nn[vn3]
-					m.normals.append(vn3)
-				
-				## triangle: flags, vertex index1, vertex index2, vertex index3, normal index1, normal index 2, normal index 3, smoothing group
-				m.trianglefaces.append((flags,v1,v2,v3,n1,n2,n3,sg))
+			toffset = len(cf.triangle_flags)
+			cf.vertex_flags.extend(part.vertex_flags)
+			cf.positions.extend(part.positions)
+			cf.bone_ids.extend(part.bone_ids)
+			cf.triangle_flags.extend(part.triangle_flags)
+			cf.indices.extend(part.indices)
+			cf.normals.extend(part.normals)
+			cf.uvs.extend(part.uvs)
+			cf.sgs.extend(part.sgs)
+			cf.g_idxs.extend(part.g_idxs)
+			g.triangles = list(range(toffset, len(cf.triangle_flags)))
 			
-			self.meshes.append(m)
+			cf.groups.append(g)
+		if use_workers(workers):
+			pool.shutdown()
+		cf.update_ref_counts()
+	
+	def get_columns(self, cf):
+		pos = cf.positions
+		vertex_rows = [(cf.vertex_flags[i], pos[i*3], pos[i*3+1], pos[i*3+2], cf.bone_ids[i])
+			for i in range(0, len(cf.vertex_flags))]
+		if numpy != None:
+			np_indices = numpy.frombuffer(cf.indices, dtype=cf.indices.typecode).reshape(-1, 3)
+			np_uvs = numpy.frombuffer(cf.uvs, dtype=cf.uvs.typecode).reshape(-1, 2, 3)
+			np_normals = numpy.frombuffer(cf.normals, dtype=cf.normals.typecode).reshape(-1, 3, 3)
+		indices = cf.indices
+		normals = cf.normals
+		uvs = cf.uvs
+		for g in cf.groups:
+			tri_flags = [cf.triangle_flags[i] for i in g.triangles]
+			tri_sgs = [cf.sgs[i] for i in g.triangles]
+			if numpy != None and len(g.triangles) * 3 >= WELD_NUMPY_MIN_CORNERS:
+				## Rows of u, v per corner
+				tris = numpy.array(g.triangles, dtype=numpy.intp)
+				m = weld_group_numpy(g, tri_flags, tri_sgs,
+					np_indices[tris].reshape(-1).astype(numpy.intp),
+					np_uvs[tris].transpose(0, 2, 1).reshape(-1, 2).astype(numpy.float64),
+					np_normals[tris].reshape(-1, 3).astype(numpy.float64),
+					vertex_rows, self.normal_bits)
+				self.meshes.append(m)
+				continue
+			corner_vs = []
+			corner_uvs = []
+			corner_vns = []
+			for tri_idx in g.triangles:
+				corner_vs.extend(indices[tri_idx*3:tri_idx*3+3])
+				uv = uvs[tri_idx*6:tri_idx*6+6]
+				corner_uvs.extend(((uv[0], uv[3]), (uv[1], uv[4]), (uv[2], uv[5])))
+				vn = normals[tri_idx*9:tri_idx*9+9]
+				corner_vns.extend(((vn[0], vn[1], vn[2]), (vn[3], vn[4], vn[5]), (vn[6], vn[7], vn[8])))
+			self.meshes.append(weld_group(g, tri_flags, tri_sgs, corner_vs, corner_uvs, corner_vns, vertex_rows, self.normal_bits))
+
+
+## Columns of one mesh for set_columns(), its vertex indices start at
+## voffset
+def mesh_columns(mesh, voffset, gidx):
+	cf = MS3DColumnFile()
+	vertices_0 = mesh.vertices
+	normals_0 = mesh.normals
+	for (flags, v_x, v_y, v_z, v_u, v_v, boneindex) in vertices_0:
+		cf.vertex_flags.append(flags)
+		cf.positions.extend((v_x, v_y, v_z))
+		cf.bone_ids.append(boneindex)
+	
+	for (flags, idx1, idx2, idx3, nidx1, nidx2, nidx3, smoothinggroup) in mesh.trianglefaces:
+		cf.triangle_flags.append(flags)
+		cf.indices.extend((voffset + idx1, voffset + idx2, voffset + idx3))
+		cf.normals.extend(list_triple(normals_0[nidx1]) + list_triple(normals_0[nidx2]) + list_triple(normals_0[nidx3]))
+		cf.uvs.extend((vertices_0[idx1][4], vertices_0[idx2][4], vertices_0[idx3][4],
+			vertices_0[idx1][5], vertices_0[idx2][5], vertices_0[idx3][5]))
+		cf.sgs.append(smoothinggroup)
+		cf.g_idxs.append(gidx)
+	return cf
+
+def mesh_columns_task(task):
+	(mi, voffset, gidx) = task
+	return mesh_columns(worker_state[mi], voffset, gidx)
+
+##
+## get() of several groups in a process pool. The workers are handed
+## the triangles and vertex rows of the whole file when they start and
+## each task is a group index, so only the meshes are pickled.
+##
+def get_groups_parallel(ms3df, todo, vertex_rows, normal_bits, workers, mp_context=None):
+	pool = worker_pool(workers, (ms3df.groups, ms3df.triangles, vertex_rows, normal_bits), mp_context)
+	results = list(pool.map(get_group_task, todo))
+	pool.shutdown()
+	return results
+
+def get_group_task(gi):
+	(groups, triangles, vertex_rows, normal_bits) = worker_state
+	return MeshHelper(normal_bits=normal_bits).get_group(groups[gi], vertex_rows, triangles)
+
+## workers, wherever it is taken, is how many processes to spread the
+## work over. None and 1 both do the work in the calling process without
+## starting a pool.
+def use_workers(workers):
+	return workers != None and workers > 1
+
+## What the tasks of a worker_pool() work on
+worker_state = None
+
+def init_worker(state):
+	global worker_state
+	worker_state = state
+
+## Process pool whose workers have state in worker_state. The state is
+## handed over once per process when it starts, pickled unless the
+## start method is fork.
+def worker_pool(workers, state, mp_context=None):
+	return ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+		initializer=init_worker, initargs=(state,))
+
+
+## Groups with at least this many triangle corners are welded with
+## numpy, by get() and get_columns() alike
+WELD_NUMPY_MIN_CORNERS = 4096
 
+##
+## Mesh of a group from its triangle corners. Corners become one mesh
+## vertex per distinct (vertex index, uv), so uv seams keep their own
+## vertices, and one normal per distinct normal. Vertices and normals
+## are numbered in the order they are first used.
+##
+def weld_group(g, tri_flags, tri_sgs, corner_vs, corner_uvs, corner_vns, vertex_rows, normal_bits=None):
+	(welded, vidx) = weld_corners(corner_vs, corner_uvs)
+	(normals, nidx) = weld(corner_vns, normal_quantizer(normal_bits))
+	return group_mesh(g, tri_flags, tri_sgs, welded, vidx, normals, nidx, vertex_rows)
+
+## Same as weld_group with the corners in numpy arrays, (N,) vertex
+## indices, (N,2) uvs and (N,3) normals
+def weld_group_numpy(g, tri_flags, tri_sgs, corner_vs, corner_uvs, corner_vns, vertex_rows, normal_bits=None):
+	(first, vidx) = weld_rows_numpy([corner_vs, corner_uvs[:, 0], corner_uvs[:, 1]])
+	welded = zip(corner_vs[first].tolist(), corner_uvs[first, 0].tolist(), corner_uvs[first, 1].tolist())
+	vn_keys = corner_vns
+	if normal_bits != None:
+		## as in normal_quantizer, normals that are not finite are kept
+		vn_keys = numpy.rint(corner_vns * normal_scale(normal_bits))
+		finite = numpy.isfinite(corner_vns).all(axis=1)
+		vn_keys = numpy.where(finite[:, None], vn_keys, corner_vns)
+	(first, nidx) = weld_rows_numpy([vn_keys[:, 0], vn_keys[:, 1], vn_keys[:, 2]])
+	normals = list(zip(*corner_vns[first].T.tolist()))
+	return group_mesh(g, tri_flags, tri_sgs, welded, vidx, normals, nidx, vertex_rows)
+
+def group_mesh(g, tri_flags, tri_sgs, welded, vidx, normals, nidx, vertex_rows):
+	m = Mesh()
+	m.meshname = g.name
+	m.meshflags = g.flags
+	m.materialindex = g.mat_index
+	m.vertices = []
+	for (v_i, uv_u, uv_v) in welded:
+		(flags, v_x, v_y, v_z, bone_id) = vertex_rows[v_i]
+		m.vertices.append((flags, v_x, v_y, v_z, uv_u, uv_v, bone_id))
+	m.normals = normals
+	## triangle: flags, vertex index1, vertex index2, vertex index3, normal index1, normal index 2, normal index 3, smoothing group
+	m.trianglefaces = list(zip(tri_flags, vidx[0::3], vidx[1::3], vidx[2::3], nidx[0::3], nidx[1::3], nidx[2::3], tri_sgs))
+	return m
+
+##
+## The distinct keys in the order they first appear, and for each key
+## the index of its distinct key. With quantize, keys are the same when
+## their quantized keys are and the first one stands for all of them.
+##
+def weld(keys, quantize=None):
+	index = {}
+	distinct = []
+	inverse = []
+	for k in keys:
+		q_k = k if quantize == None else quantize(k)
+		i = index.get(q_k)
+		if i == None:
+			i = index[q_k] = len(distinct)
+			distinct.append(k)
+		inverse.append(i)
+	return (distinct, inverse)
+
+##
+## Normals are unit vectors, with bits per component each component is
+## rounded to a step of 1/(2^(bits-1) - 1). Nearby normals that fall on
+## either side of a step boundary stay apart.
+##
+def normal_scale(bits):
+	return float((1 << (bits - 1)) - 1)
+
+def normal_quantizer(bits):
+	if bits == None:
+		return None
+	scale = normal_scale(bits)
+	def quantize(vn):
+		(n_x, n_y, n_z) = vn
+		if not (isfinite(n_x) and isfinite(n_y) and isfinite(n_z)):
+			## NaN and infinite normals (degenerate triangles) cannot be
+			## rounded. Infinite ones are merged when exactly the same, NaN
+			## is not the same as anything (as in weld_group_numpy).
+			if n_x != n_x or n_y != n_y or n_z != n_z:
+				return object()
+			return vn
+		return (round(n_x * scale), round(n_y * scale), round(n_z * scale))
+	return quantize
+
+## weld() of (vertex index, u, v), looked up by the vertex index first
+## since most vertices only have the one uv
+def weld_corners(corner_vs, corner_uvs):
+	first = {}
+	seams = {}
+	welded = []
+	inverse = []
+	for (v_i, uv) in zip(corner_vs, corner_uvs):
+		e = first.get(v_i)
+		if e == None:
+			i = len(welded)
+			first[v_i] = (uv, i)
+			welded.append((v_i, uv[0], uv[1]))
+		elif e[0] == uv:
+			i = e[1]
+		else:
+			i = seams.get((v_i, uv))
+			if i == None:
+				i = seams[(v_i, uv)] = len(welded)
+				welded.append((v_i, uv[0], uv[1]))
+		inverse.append(i)
+	return (welded, inverse)
+
+##
+## weld() of the rows of columns by sorting. lexsort is stable so each
+## run of equal rows starts with its first corner. Returns the first
+## corner of each distinct row in order of use and the inverse list.
+##
+def weld_rows_numpy(cols):
+	num = len(cols[0])
+	## -0.0 is the same as 0.0
+	cols = [c + 0 for c in cols]
+	order = numpy.lexsort(cols[::-1])
+	starts = numpy.zeros(num, dtype=bool)
+	starts[0] = True
+	for c in cols:
+		s_c = c[order]
+		starts[1:] |= s_c[1:] != s_c[:-1]
+	run = numpy.cumsum(starts) - 1
+	first = order[starts]
+	by_use = numpy.argsort(first, kind="stable")
+	rank = numpy.empty(len(first), dtype=numpy.intp)
+	rank[by_use] = numpy.arange(len(first))
+	inverse = numpy.empty(num, dtype=numpy.intp)
+	inverse[order] = rank[run]
+	return (first[by_use], inverse.tolist())
@@ -8,24 +8,38 @@
 ##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
 ##
 
+## Index of the first mesh in meshes having one of the edges of m the
+## other way around, None if there is none
 def first_common(m, meshes):
-	vv = []
-	el = []
-	for v in m.vertices:
-		(flags, v_x,v_y,v_z, u,v, bindex) = v
-		vv.append((v_x,v_y,v_z))
-	for t in m.trianglefaces:
-		(flags, v1,v2,v3, n1,n2,n3, sg) = t
-		el.append((vv[v2],vv[v1]))
-		el.append((vv[v3],vv[v2]))
-		el.append((vv[v1],vv[v3]))
-	i = 0;
-	for mc in meshes:
-		elcomp = rev_edgecoords(mc)
-		for e in el:
-			if e in elcomp:
-				return i
+	return first_reversed(rev_edgecoords(m), edge_index(meshes))
+
+## first_common() of every mesh in meshes, with the edges of all meshes
+## put in one dict instead of being searched per pair of meshes. This
+## is not the same as joining meshes that share edges into connected
+## parts, a mesh gets the first mesh it shares an edge with itself
+## even when that one is joined to an earlier mesh through another.
+def first_commons(meshes):
+	index = edge_index(meshes)
+	return [first_reversed(rev_edgecoords(m), index) for m in meshes]
+
+## Each directed edge by its end points, with the index of the first
+## mesh having it
+def edge_index(meshes):
+	index = {}
+	i = 0
+	for m in meshes:
+		for e in rev_edgecoords(m):
+			index.setdefault(e, i)
 		i = i + 1
+	return index
+
+def first_reversed(el, index):
+	first = None
+	for (a, b) in el:
+		i = index.get((b, a))
+		if i != None and (first == None or i < first):
+			first = i
+	return first
 
 def rev_edgecoords(m):
 	el = []
@@ -54,3 +68,60 @@ def alledges(fs):
 			al.append((v1,v2))
 			i = i + 1
 	return al
+
+##
+## Hard edges of the faces fs: edges where the two faces on either side
+## are in different smoothing groups (sgs has one per face) or have
+## different normals at one of its ends. Faces are paired up through a
+## dict keyed by the positions of the ends, so faces meeting at a uv
+## seam, where the vertices are split, are paired as well. Edges with
+## a face on one side only are left out.
+##
+def hard_edges(fs, vs, ns, sgs):
+	## Vertices at the same place and normals that are the same get the
+	## same id, the tables then only hold ints
+	vids = value_ids(vs)
+	nids = value_ids(ns)
+	## The first and second face side of each edge, any more go in
+	## others
+	first = {}
+	second = {}
+	others = {}
+	hard = {}
+	fi = 0
+	for f in fs:
+		fvs = f.vs
+		fns = f.ns
+		sg = sgs[fi]
+		for (v1, v2, n1, n2) in zip(fvs, fvs[1:] + fvs[:1], fns, fns[1:] + fns[:1]):
+			a = vids[v1]
+			b = vids[v2]
+			## ends in key order for comparing the normals
+			if a <= b:
+				key = (a, b)
+				half = (v1, v2, nids[n1], nids[n2], sg)
+			else:
+				key = (b, a)
+				half = (v1, v2, nids[n2], nids[n1], sg)
+			h = first.setdefault(key, half)
+			if h is not half:
+				if second.setdefault(key, half) is not half:
+					others.setdefault(key, []).append(half)
+				if h[4] != sg or h[2] != half[2] or h[3] != half[3]:
+					hard[key] = True
+		fi = fi + 1
+	
+	he = []
+	for key in hard:
+		## One per face side unless the faces share the vertices
+		pairs = []
+		for (v1, v2, _, _, _) in [first[key], second[key]] + others.get(key, []):
+			if not (v1, v2) in pairs and not (v2, v1) in pairs:
+				pairs.append((v1, v2))
+		he.extend(pairs)
+	return he
+
+## Numbers the distinct values, equal values get the same number
+def value_ids(values):
+	ids = {}
+	return [ids.setdefault(v, len(ids)) for v in values]
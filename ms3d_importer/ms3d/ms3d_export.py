@@ -9,7 +9,8 @@
 ##
 
 import struct
-from ms3d.ms3d_cls import MS3DFileComments, MS3DFile, MS3DVertex, MS3DTriangle, MS3DGroup, MS3DMaterial, MS3DJoint, MS3DVertex_ex, MS3DJoint_ex, MS3DModel_ex, Mesh, MeshHelper
+from ms3d.ms3d_import import open_ms3d_file, is_txt_file
+from ms3d.ms3d_cls import MS3DColumnFile, MS3DFileComments, MS3DFile, MS3DVertex, MS3DTriangle, MS3DGroup, MS3DMaterial, MS3DJoint, MS3DVertex_ex, MS3DJoint_ex, MS3DModel_ex, Mesh, MeshHelper
 
 ##
 ## max values
@@ -53,7 +54,7 @@ def file_write_float(fp, val):
 	
 
 def write_ms3d_file(flname, ms3df):
-	if flname[-4:].lower() == '.txt':
+	if is_txt_file(flname):
 		write_ms3d_txt_file(flname, ms3df)
 	else:
 		write_ms3d_bin_file(flname, ms3df)
@@ -64,10 +65,8 @@ def write_ms3d_file(flname, ms3df):
 ##
 
 def write_ms3d_bin_file(flname, ms3df):
-	fp = open(flname, "wb")
+	fp = open_ms3d_file(flname, "wb")
 	
-	vertices = ms3df.vertices
-	triangles = ms3df.triangles
 	groups = ms3df.groups
 	materials = ms3df.materials
 	anim = ms3df.anim
@@ -76,13 +75,23 @@ def write_ms3d_bin_file(flname, ms3df):
 	extra = ms3df.extra
 	ms3d_header_t(fp)
 	
-	file_write_u16(fp, len(vertices)) ## number of vertices, 2 bytes
-	for v in vertices:
-		ms3d_vertex_t(fp, v)
-	
-	file_write_u16(fp, len(triangles)) ## number of triangles, 2 bytes
-	for tri in triangles:
-		ms3d_triangle_t(fp, tri)
+	if isinstance(ms3df, MS3DColumnFile):
+		## Columns are written as whole sections
+		num_vertices = ms3df.num_vertices()
+		file_write_u16(fp, num_vertices) ## number of vertices, 2 bytes
+		fp.write(ms3df.vertex_data())
+		
+		file_write_u16(fp, ms3df.num_triangles()) ## number of triangles, 2 bytes
+		fp.write(ms3df.triangle_data())
+	else:
+		num_vertices = len(ms3df.vertices)
+		file_write_u16(fp, num_vertices) ## number of vertices, 2 bytes
+		for v in ms3df.vertices:
+			ms3d_vertex_t(fp, v)
+		
+		file_write_u16(fp, len(ms3df.triangles)) ## number of triangles, 2 bytes
+		for tri in ms3df.triangles:
+			ms3d_triangle_t(fp, tri)
 	
 	file_write_u16(fp, len(groups)) ## number of groups, 2 bytes
 	for g in groups:
@@ -135,14 +144,12 @@ def write_ms3d_bin_file(flname, ms3df):
 		## vertex extra information
 		sub_version = 2
 		file_write_u32(fp, sub_version)        ## subVersion is = 3, 4 bytes
-		i = 0
-		for v0 in vertices:
+		for i in range(0, num_vertices):
 			if i >= len(ex_vs):
 				v = None
 			else:
 				v = ex_vs[i]
 			ms3d_vertex_ex_t(fp, sub_version, v)
-			i = i + 1
 		
 		## joint extra information
 		sub_version = 1
@@ -160,7 +167,8 @@ def write_ms3d_bin_file(flname, ms3df):
 		sub_version = 1
 		file_write_u32(fp, sub_version)        ## subVersion is = 1, 4 bytes
 		ms3d_model_ex_t(fp, sub_version, ex_md)
-		
+	
+	fp.close()
 
 
 
@@ -432,7 +440,7 @@ def write_ms3d_txt_file(flname, ms3df):
 	meshes = mh.meshes
 	materials = ms3df.materials
 	
-	fp = open(flname, "w", encoding="utf-8")
+	fp = open_ms3d_file(flname, "w")
 	
 	write_txt_header(fp)
 	write_txt_newline(fp)
@@ -458,6 +466,7 @@ def write_ms3d_txt_file(flname, ms3df):
 	write_txt_section(fp, "MaterialComments", 0)
 	write_txt_section(fp, "BoneComments", 0)
 	write_txt_section(fp, "ModelComment", 0)
+	fp.close()
 	
 	
 def write_txt_mesh(fp, mesh):
@@ -474,24 +483,18 @@ def write_txt_mesh(fp, mesh):
 	
 	## Number of vertices
 	write_txt_line_number(fp, len(vertices))
-	for v in vertices:
-		(flags, v_x, v_y, v_z, v_u, v_v, boneindex) = v
-		## Vertex flags, x, y, z, u, v, bone index
-		write_txt_line(fp, "ifffffi", [flags, v_x, v_y, v_z, v_u, v_v, boneindex])
+	## Vertex flags, x, y, z, u, v, bone index
+	write_txt_rows(fp, "ifffffi", vertices)
 	
 	## Number of normals
 	write_txt_line_number(fp, len(normals))
-	for n in normals:
-		(n_x, n_y, n_z) = n
-		## Normal x, y, z
-		write_txt_line(fp, "fff", [n_x, n_y, n_z])
+	## Normal x, y, z
+	write_txt_rows(fp, "fff", normals)
 	
 	## Number of triangles
 	write_txt_line_number(fp, len(trianglefaces))
-	for tri in trianglefaces:
-		(flags, idx1, idx2, idx3, nidx1, nidx2, nidx3, smoothinggroup) = tri
-		## Triangle flags, vertex index1, vertex index2, vertex index3, normal index1, normal index 2, normal index 3, smoothing group
-		write_txt_line(fp, "iiiiiiii", [flags, idx1, idx2, idx3, nidx1, nidx2, nidx3, smoothinggroup])
+	## Triangle flags, vertex index1, vertex index2, vertex index3, normal index1, normal index 2, normal index 3, smoothing group
+	write_txt_rows(fp, "iiiiiiii", trianglefaces)
 
 	
 
@@ -582,7 +585,6 @@ def write_txt_line(fp, valuestypes, valueslist):
 		tp = valuestypes[i]
 		val = valueslist[i]
 		if tp == 's':
-			print(";;" + str(val))
 			fp.write("\"%s\"" % (val))
 		elif tp == 'i':
 			fp.write("%d" % (val))
@@ -590,6 +592,12 @@ def write_txt_line(fp, valuestypes, valueslist):
 			fp.write("%.06f" % (val))
 	fp.write("\n")
 
+## Rows of numbers that all have the same layout
+TXT_ROW_FORMAT = {"i": "%d", "f": "%.06f"}
+def write_txt_rows(fp, valuestypes, rows):
+	fmt = " ".join([TXT_ROW_FORMAT[tp] for tp in valuestypes]) + "\n"
+	fp.write("".join([fmt % tuple(row) for row in rows]))
+
 def write_txt_header(fp):
 	fp.write("// MilkShape 3D ASCII\n")
 def write_txt_newline(fp):
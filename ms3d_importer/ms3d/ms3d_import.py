@@ -8,9 +8,23 @@
 ##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
 ##
 
+import io
+import gzip
+import lzma
+import mmap
+import re
 import struct
-from ms3d.ms3d_cls import MS3DFileComments, MS3DFile, MS3DVertex, MS3DTriangle, MS3DGroup, MS3DMaterial, MS3DJoint, MS3DVertex_ex, MS3DJoint_ex, MS3DModel_ex, Mesh, MeshHelper
-
+import time
+from itertools import islice
+from operator import length_hint
+from concurrent.futures import ProcessPoolExecutor
+from ms3d.ms3d_cls import MS3DArrayFile, MS3DColumnFile, MS3DIndex, MS3DFileComments, MS3DFile, MS3DVertex, MS3DTriangle, MS3DGroup, MS3DMaterial, MS3DJoint, MS3DVertex_ex, MS3DJoint_ex, MS3DModel_ex, Mesh, MeshHelper, use_workers
+from ms3d.ms3d_pack import pack_ms3d_file, unpack_ms3d_file
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 ##
 ## flags
@@ -20,10 +34,133 @@ READER_HIDDEN = 2
 READER_SELECTED2 = 4
 READER_DIRTY = 8
 
-def file_read_str(fp, size):
-	strval = fp.read(size)
+## Bumped whenever the decoded MS3DFile changes, so that cached
+## results of older readers are not used.
+READER_VERSION = 1
+
+##
+## sections to read
+##
+READ_GEOMETRY = 1    ## vertices, triangles and groups
+READ_MATERIALS = 2
+READ_JOINTS = 4      ## joints and their key frames
+READ_COMMENTS = 8
+READ_EXTRA = 16      ## vertex, joint and model extra information
+READ_ALL = READ_GEOMETRY | READ_MATERIALS | READ_JOINTS | READ_COMMENTS | READ_EXTRA
+
+##
+## Fixed size records, little endian and without padding
+##
+VERTEX_STRUCT = struct.Struct("<BfffbB")              ## 15 bytes
+TRIANGLE_STRUCT = struct.Struct("<4H9f6fBB")          ## 70 bytes
+GROUP_STRUCT = struct.Struct("<B32sH")                ## 35 bytes, followed by the triangle indices
+MATERIAL_STRUCT = struct.Struct("<32s16fffb128s128s") ## 361 bytes
+ANIM_STRUCT = struct.Struct("<ffI")                   ## 12 bytes
+JOINT_STRUCT = struct.Struct("<B32s32s6fHH")          ## 93 bytes, followed by the key frames
+KEYFRAME_STRUCT = struct.Struct("<4f")                ## 16 bytes
+COMMENT_STRUCT = struct.Struct("<II")                 ## 8 bytes, followed by the comment
+POSITION_STRUCT = struct.Struct("<x3fxx")             ## x, y, z of a vertex record
+SHARE_KEY_2 = struct.Struct("<2d")                    ## bits of shared tuples holding a zero
+SHARE_KEY_3 = struct.Struct("<3d")
+VERTEX_EX_STRUCTS = {
+	1: struct.Struct("<bbbBBB"),                      ## 6 bytes
+	2: struct.Struct("<bbbBBBI"),                     ## 10 bytes
+	3: struct.Struct("<bbbBBBII"),                    ## 14 bytes
+}
+JOINT_EX_STRUCT = struct.Struct("<fff")               ## 12 bytes
+MODEL_EX_STRUCT = struct.Struct("<fIf")               ## 12 bytes
+
+if numpy != None:
+	## The same records as numpy structured types, for mapping whole
+	## sections without copying.
+	VERTEX_DTYPE = numpy.dtype([
+		("flags", "u1"),
+		("position", "<f4", (3,)),
+		("bone_id", "i1"),
+		("ref_count", "u1")])
+	TRIANGLE_DTYPE = numpy.dtype([
+		("flags", "<u2"),
+		("indices", "<u2", (3,)),
+		("normals", "<f4", (3, 3)),
+		("uvs", "<f4", (2, 3)),   ## u1, u2, u3 then v1, v2, v3
+		("sg", "u1"),
+		("g_idx", "u1")])
+
+##
+## Compressed files are found by their suffix, or else by the magic
+## bytes at the start of the file.
+##
+COMPRESSION_SUFFIXES = ((".gz", "gzip"), (".xz", "xz"))
+COMPRESSION_MAGIC = ((b"\x1f\x8b", "gzip"), (b"\xfd7zXZ\x00", "xz"))
+COMPRESSED_BUFFER_SIZE = 1024*1024
+
+def file_compression(flname, mode="r"):
+	for (suffix, compression) in COMPRESSION_SUFFIXES:
+		if flname.lower().endswith(suffix):
+			return compression
+	if mode[0] != "r":
+		return None
+	fp = open(flname, "rb")
+	magic = fp.read(6)
+	fp.close()
+	for (magic_1, compression) in COMPRESSION_MAGIC:
+		if magic.startswith(magic_1):
+			return compression
+	return None
+
+## File name without the compression suffix
+def file_base_name(flname):
+	for (suffix, compression) in COMPRESSION_SUFFIXES:
+		if flname.lower().endswith(suffix):
+			return flname[0:-len(suffix)]
+	return flname
+
+def is_txt_file(flname):
+	return file_base_name(flname)[-4:].lower() == ".txt"
+
+## mode is "rb", "wb", "r" or "w", text is utf-8
+def open_ms3d_file(flname, mode="rb"):
+	compression = file_compression(flname, mode)
+	if compression == None:
+		if "b" in mode:
+			return open(flname, mode)
+		return open(flname, mode, encoding="utf-8")
+	if compression == "gzip":
+		fp = gzip.GzipFile(flname, mode[0] + "b")
+	else:
+		fp = lzma.LZMAFile(flname, mode[0] + "b")
+	## Large reads and writes to the decompressor
+	if mode[0] == "r":
+		fp = io.BufferedReader(fp, COMPRESSED_BUFFER_SIZE)
+	else:
+		fp = io.BufferedWriter(fp, COMPRESSED_BUFFER_SIZE)
+	if not "b" in mode:
+		fp = io.TextIOWrapper(fp, encoding="utf-8")
+	return fp
+
+## Compressed files are decompressed into memory so that seeking
+## around in them is cheap
+def open_ms3d_file_seekable(flname):
+	if file_compression(flname) == None:
+		return open(flname, "rb")
+	fp = open_ms3d_file(flname, "rb")
+	data = fp.read()
+	fp.close()
+	return io.BytesIO(data)
+
+def bytes_str(strval):
 	strval = strval.rstrip(b'\0')
 	return strval.decode('ascii') # 'iso-8859-1' ?
+def file_read_str(fp, size):
+	strval = fp.read(size)
+	return bytes_str(strval)
+def file_skip(fp, size):
+	fp.seek(size, 1)
+def file_read_block(fp, size):
+	bt = fp.read(size)
+	if len(bt) != size:
+		raise Exception("EOF")
+	return bt
 def file_read_u8_maybe(fp):
 	## 1 byte
 	bt = fp.read(1)
@@ -85,98 +222,360 @@ def file_read_float(fp):
 		raise "EOF"
 	return v
 	
-def read_ms3d_file(flname):
-	if flname[-4:].lower() == ".txt":
+def read_ms3d_file(flname, lazy=False, sections=READ_ALL, cache=None):
+	if cache != None:
+		return cache.read_ms3d_file(flname, sections)
+	elif is_txt_file(flname):
 		return read_ms3d_txt_file(flname)
+	elif lazy:
+		return read_ms3d_bin_file_lazy(flname)
 	else:
-		return read_ms3d_bin_file(flname)
+		return read_ms3d_bin_file(flname, sections)
+
+##
+## Read many files, in a process pool when given more than one worker
+## (see use_workers). Each file is returned packed (see ms3d_pack) which
+## keeps the transfer back from the workers cheap, MS3DLoadResult.load()
+## unpacks it. A file that fails to read has its error set instead of
+## stopping the other files.
+##
+
+class MS3DLoadResult:
+	def __init__(self, flname, data, seconds, error):
+		self.flname = flname
+		self.data = data
+		self.seconds = seconds
+		self.error = error
+	
+	def load(self):
+		if self.data == None:
+			return None
+		return unpack_ms3d_file(self.data)
+
+
+def read_ms3d_files(flnames, workers=None, sections=READ_ALL):
+	results = []
+	if not use_workers(workers):
+		for flname in flnames:
+			(data, seconds, error) = read_ms3d_file_packed(flname, sections)
+			results.append(MS3DLoadResult(flname, data, seconds, error))
+		return results
+	
+	pool = ProcessPoolExecutor(max_workers=workers)
+	futures = [pool.submit(read_ms3d_file_packed, flname, sections) for flname in flnames]
+	for (flname, fut) in zip(flnames, futures):
+		try:
+			(data, seconds, error) = fut.result()
+		except Exception as e:
+			## The worker itself went away
+			(data, seconds, error) = (None, 0.0, str(e))
+		results.append(MS3DLoadResult(flname, data, seconds, error))
+	pool.shutdown()
+	return results
+
+def read_ms3d_file_packed(flname, sections):
+	t0 = time.perf_counter()
+	try:
+		data = pack_ms3d_file(read_ms3d_file(flname, sections=sections))
+		error = None
+	except Exception as e:
+		data = None
+		error = str(e)
+	return (data, time.perf_counter() - t0, error)
 
 ## Read Milkshape 3D MS3D Files
 
-def read_ms3d_bin_file(flname):
-	fp = open(flname, "rb")
+def read_ms3d_bin_file(flname, sections=READ_ALL):
+	## Read the whole file in one go, the sections are then decoded
+	## from the in-memory buffer.
+	fp = open_ms3d_file(flname, "rb")
+	data = fp.read()
+	fp.close()
+	return read_ms3d_bin_stream(io.BytesIO(data), sections)
+
+def read_ms3d_bin_stream(fp, sections=READ_ALL):
 	if not ms3d_header_t(fp):
 		raise Exception("Not a ms3d file")
-		
-	## number of vertices, 2 bytes
-	vertices = []
-	num_vertices = file_read_u16(fp)
-	for i in range(0, num_vertices):
-		v = ms3d_vertex_t(fp)
-		vertices.append(v)
 	
-	triangles = []
+	msf = MS3DFile()
+	
+	## Sections that were not asked for are seeked past and left empty
+	num_vertices = file_read_u16(fp) ## number of vertices, 2 bytes
+	if sections & READ_GEOMETRY:
+		msf.vertices = ms3d_vertices_t(fp, num_vertices)
+	else:
+		file_skip(fp, num_vertices * VERTEX_STRUCT.size)
+	
 	num_triangles = file_read_u16(fp) ## number of triangles, 2 bytes
-	for i in range(0, num_triangles):
-		tri = ms3d_triangle_t(fp)
-		triangles.append(tri)
+	if sections & READ_GEOMETRY:
+		msf.triangles = ms3d_triangles_t(fp, num_triangles)
+	else:
+		file_skip(fp, num_triangles * TRIANGLE_STRUCT.size)
 	
-	groups = []
 	num_groups = file_read_u16(fp) ## number of groups, 2 bytes
-	for i in range(0, num_groups):
-		g = ms3d_group_t(fp)
-		groups.append(g)
+	if sections & READ_GEOMETRY:
+		msf.groups = ms3d_groups_t(fp, num_groups)
+	else:
+		ms3d_skip_groups(fp, num_groups)
 	
-	materials = []
 	num_materials = file_read_u16(fp)  ## number of materials, 2 bytes
-	for i in range(0, num_materials):
-		m = ms3d_material_t(fp)
-		materials.append(m)
+	if sections & READ_MATERIALS:
+		msf.materials = ms3d_materials_t(fp, num_materials)
+	else:
+		file_skip(fp, num_materials * MATERIAL_STRUCT.size)
 	
 	## keyframer data
-	animation_fps = file_read_float(fp) ## 4 bytes
-	current_time = file_read_float(fp) ## 4 bytes
-	total_frames = file_read_u32(fp) ## 4 bytes
-	anim = (animation_fps, current_time,total_frames)
+	msf.anim = ms3d_anim_t(fp)
 	
-	joints = []
 	num_joints = file_read_u16(fp) ## number of joints, 2 bytes
-	for i in range(0, num_joints):
-		j = ms3d_joint_t(fp)
-		joints.append(j)
+	if sections & READ_JOINTS:
+		msf.joints = ms3d_joints_t(fp, num_joints)
+	elif sections & (READ_COMMENTS | READ_EXTRA):
+		ms3d_skip_joints(fp, num_joints)
+	
+	if not sections & (READ_COMMENTS | READ_EXTRA):
+		return msf
 	
-	group_comments = []
-	material_comments = []
-	joint_comments = []
-	model_comment = []
-	extra = (None,None,None)
+	if sections & READ_COMMENTS:
+		msf.comments = MS3DFileComments()
+	if sections & READ_EXTRA:
+		msf.extra = (None,None,None)
 	sub_version = file_read_u32(fp) ## subVersion is = 1, 4 bytes
 	if sub_version > 0:
-		num_group_comments = file_read_u32(fp) ## 4 bytes
-		for i in range(0, num_group_comments):
-			c = ms3d_comment_t(fp)
-			group_comments.append(c)
-		num_material_comments = file_read_u32(fp) ## 4 bytes
-		for i in range(0, num_material_comments):
-			c = ms3d_comment_t(fp)
-			material_comments.append(c)
-		num_joint_comments = file_read_u32(fp) ## 4 bytes
-		for i in range(0, num_joint_comments):
-			c = ms3d_comment_t(fp)
-			joint_comments.append(c)
-		has_model_comment = file_read_u32(fp) ## 4 bytes
-		for i in range(0, has_model_comment):
-			c = ms3d_comment_t(fp)
-			model_comment.append(c)
-		extra = ms3d_extra(fp, num_vertices, num_joints)
+		if sections & READ_COMMENTS:
+			msf.comments = ms3d_comments_t(fp)
+		elif sections & READ_EXTRA:
+			ms3d_skip_comments(fp)
+		if sections & READ_EXTRA:
+			msf.extra = ms3d_extra(fp, num_vertices, num_joints)
+	return msf
 
-	comments = MS3DFileComments()
-	comments.group_comments = group_comments
-	comments.material_comments = material_comments
-	comments.joint_comments = joint_comments
-	comments.model_comment = model_comment
+
+##
+## Summary of a file for catalogues, everything past the section headers
+## is skipped except the materials and the vertex positions.
+##
+def read_ms3d_index(flname):
+	fp = open_ms3d_file_seekable(flname)
+	sections = ms3d_sections_t(fp)
 	
-	msf = MS3DFile()
-	msf.vertices = vertices
-	msf.triangles = triangles
-	msf.groups = groups
-	msf.materials = materials
-	msf.anim = anim
-	msf.joints = joints
-	msf.comments = comments
-	msf.extra = extra
+	idx = MS3DIndex()
+	(offset, idx.num_vertices) = sections["vertices"]
+	(_, idx.num_triangles) = sections["triangles"]
+	(offset_g, idx.num_groups) = sections["groups"]
+	(offset_m, num_materials) = sections["materials"]
+	(offset_a, _) = sections["anim"]
+	(_, idx.num_joints) = sections["joints"]
+	
+	## Bounding box from the vertex block alone
+	fp.seek(offset)
+	data = file_read_block(fp, idx.num_vertices * VERTEX_STRUCT.size)
+	if idx.num_vertices > 0:
+		(xs, ys, zs) = zip(*POSITION_STRUCT.iter_unpack(data))
+		idx.bounds = ((min(xs), min(ys), min(zs)), (max(xs), max(ys), max(zs)))
+	
+	fp.seek(offset_g)
+	for i in range(0, idx.num_groups):
+		(flags, name, numtriangles) = GROUP_STRUCT.unpack(file_read_block(fp, GROUP_STRUCT.size))
+		file_skip(fp, numtriangles * 2 + 1)
+		idx.group_names.append(bytes_str(name))
+	
+	fp.seek(offset_m)
+	for mat in ms3d_materials_t(fp, num_materials):
+		idx.material_names.append(mat.name)
+		for texname in (mat.imagemap, mat.alphamap):
+			if texname != "" and not texname in idx.texture_names:
+				idx.texture_names.append(texname)
+	
+	fp.seek(offset_a)
+	(idx.animation_fps, current_time, idx.total_frames) = ms3d_anim_t(fp)
+	fp.close()
+	return idx
+
+
+##
+## Read the vertex and triangle sections as numpy arrays that share
+## the file buffer instead of one object per element.
+##
+def read_ms3d_bin_arrays(flname):
+	if numpy == None:
+		raise Exception("numpy is required for reading into arrays")
+	fp = open_ms3d_file(flname, "rb")
+	data = fp.read()
+	fp.close()
+	
+	fp = io.BytesIO(data)
+	sections = ms3d_sections_t(fp)
+	
+	(offset, num_vertices) = sections["vertices"]
+	vs = numpy.frombuffer(data, VERTEX_DTYPE, num_vertices, offset)
+	(offset, num_triangles) = sections["triangles"]
+	ts = numpy.frombuffer(data, TRIANGLE_DTYPE, num_triangles, offset)
+	
+	msf = MS3DArrayFile()
+	msf.vertex_flags = vs["flags"]
+	msf.positions = vs["position"]
+	msf.bone_ids = vs["bone_id"]
+	msf.ref_counts = vs["ref_count"]
+	msf.triangle_flags = ts["flags"]
+	msf.indices = ts["indices"]
+	msf.normals = ts["normals"]
+	msf.uvs = ts["uvs"].transpose(0, 2, 1)
+	msf.sgs = ts["sg"]
+	msf.g_idxs = ts["g_idx"]
+	
+	ms3d_other_sections_t(fp, sections, msf)
 	return msf
 
+##
+## Read the vertex and triangle sections into array.array columns, for
+## when numpy is not there.
+##
+def read_ms3d_bin_columns(flname):
+	fp = open_ms3d_file(flname, "rb")
+	data = fp.read()
+	fp.close()
+	
+	fp = io.BytesIO(data)
+	sections = ms3d_sections_t(fp)
+	
+	msf = MS3DColumnFile()
+	(offset, num_vertices) = sections["vertices"]
+	msf.set_vertex_data(memoryview(data)[offset:offset + num_vertices * VERTEX_STRUCT.size], num_vertices)
+	(offset, num_triangles) = sections["triangles"]
+	msf.set_triangle_data(memoryview(data)[offset:offset + num_triangles * TRIANGLE_STRUCT.size], num_triangles)
+	
+	ms3d_other_sections_t(fp, sections, msf)
+	return msf
+
+## The sections after the triangles are small and decoded as usual
+def ms3d_other_sections_t(fp, sections, msf):
+	(offset, num_groups) = sections["groups"]
+	fp.seek(offset)
+	msf.groups = ms3d_groups_t(fp, num_groups)
+	(offset, num_materials) = sections["materials"]
+	fp.seek(offset)
+	msf.materials = ms3d_materials_t(fp, num_materials)
+	msf.anim = ms3d_anim_t(fp)
+	(offset, num_joints) = sections["joints"]
+	fp.seek(offset)
+	msf.joints = ms3d_joints_t(fp, num_joints)
+	(offset, sub_version) = sections["comments"]
+	fp.seek(offset)
+	if sub_version > 0:
+		msf.comments = ms3d_comments_t(fp)
+		msf.extra = ms3d_extra(fp, sections["vertices"][1], num_joints)
+
+
+##
+## Memory mapped reading, sections are only decoded when the matching
+## attribute is first accessed.
+##
+
+class MS3DLazyFile(MS3DFile):
+	def __init__(self, mapped, sections):
+		self.mapped = mapped
+		self.sections = sections
+	
+	def __getattr__(self, name):
+		sections = self.__dict__.get("sections")
+		if sections == None or not name in sections:
+			raise AttributeError(name)
+		(offset, count) = sections[name]
+		fp = self.mapped
+		fp.seek(offset)
+		if name == "vertices":
+			val = ms3d_vertices_t(fp, count)
+		elif name == "triangles":
+			val = ms3d_triangles_t(fp, count)
+		elif name == "groups":
+			val = ms3d_groups_t(fp, count)
+		elif name == "materials":
+			val = ms3d_materials_t(fp, count)
+		elif name == "anim":
+			val = ms3d_anim_t(fp)
+		elif name == "joints":
+			val = ms3d_joints_t(fp, count)
+		elif name == "comments":
+			val = MS3DFileComments()
+			if count > 0:
+				val = ms3d_comments_t(fp)
+		elif name == "extra":
+			val = (None,None,None)
+			if count > 0:
+				val = ms3d_extra(fp, sections["vertices"][1], sections["joints"][1])
+		setattr(self, name, val)
+		return val
+
+
+def read_ms3d_bin_file_lazy(flname):
+	if file_compression(flname) != None:
+		## Nothing to map, the decompressed file is kept in memory
+		mapped = open_ms3d_file_seekable(flname)
+	else:
+		fp = open(flname, "rb")
+		mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+		fp.close()
+	sections = ms3d_sections_t(mapped)
+	return MS3DLazyFile(mapped, sections)
+
+
+##
+## Find the offset and the number of entries of each section, seeking past
+## the section content.
+##
+def ms3d_sections_t(fp):
+	if not ms3d_header_t(fp):
+		raise Exception("Not a ms3d file")
+	sections = {}
+	
+	num_vertices = file_read_u16(fp)
+	sections["vertices"] = (fp.tell(), num_vertices)
+	file_skip(fp, num_vertices * VERTEX_STRUCT.size)
+	
+	num_triangles = file_read_u16(fp)
+	sections["triangles"] = (fp.tell(), num_triangles)
+	file_skip(fp, num_triangles * TRIANGLE_STRUCT.size)
+	
+	num_groups = file_read_u16(fp)
+	sections["groups"] = (fp.tell(), num_groups)
+	ms3d_skip_groups(fp, num_groups)
+	
+	num_materials = file_read_u16(fp)
+	sections["materials"] = (fp.tell(), num_materials)
+	file_skip(fp, num_materials * MATERIAL_STRUCT.size)
+	
+	sections["anim"] = (fp.tell(), 1)
+	file_skip(fp, ANIM_STRUCT.size)
+	
+	num_joints = file_read_u16(fp)
+	sections["joints"] = (fp.tell(), num_joints)
+	ms3d_skip_joints(fp, num_joints)
+	
+	sub_version = file_read_u32(fp)
+	sections["comments"] = (fp.tell(), sub_version)
+	if sub_version > 0:
+		ms3d_skip_comments(fp)
+	sections["extra"] = (fp.tell(), sub_version)
+	return sections
+
+def ms3d_skip_groups(fp, num_groups):
+	for i in range(0, num_groups):
+		(flags, name, numtriangles) = GROUP_STRUCT.unpack(file_read_block(fp, GROUP_STRUCT.size))
+		file_skip(fp, numtriangles * 2 + 1)
+
+def ms3d_skip_joints(fp, num_joints):
+	for i in range(0, num_joints):
+		jv = JOINT_STRUCT.unpack(file_read_block(fp, JOINT_STRUCT.size))
+		file_skip(fp, (jv[9] + jv[10]) * KEYFRAME_STRUCT.size)
+
+def ms3d_skip_comments(fp):
+	for i in range(0, 4):
+		num_comments = file_read_u32(fp)
+		for c in range(0, num_comments):
+			(index, clen) = COMMENT_STRUCT.unpack(file_read_block(fp, COMMENT_STRUCT.size))
+			file_skip(fp, clen)
+
 
 ##
 ## The header
@@ -191,74 +590,81 @@ def ms3d_header_t(fp):
 	
 
 ##
-## Vertex
+## Vertices
 ##
-def ms3d_vertex_t(fp):
-	v = MS3DVertex()
-	v.flags = file_read_u8(fp)
-	v.v_x = file_read_float(fp)
-	v.v_y = file_read_float(fp)
-	v.v_z = file_read_float(fp)
-
-	v.bone_id = file_read_s8(fp)           ## -1 = no bone
-	v.ref_count = file_read_u8(fp)
-	return v
+def ms3d_vertices_t(fp, num_vertices):
+	vertices = []
+	data = file_read_block(fp, num_vertices * VERTEX_STRUCT.size)
+	for (flags, v_x, v_y, v_z, bone_id, ref_count) in VERTEX_STRUCT.iter_unpack(data):
+		v = MS3DVertex()
+		v.flags = flags
+		v.v_x = v_x
+		v.v_y = v_y
+		v.v_z = v_z
+		v.bone_id = bone_id           ## -1 = no bone
+		v.ref_count = ref_count
+		vertices.append(v)
+	return vertices
 	
 
 ## Triangles
 ##
-def ms3d_triangle_t(fp):
-	t = MS3DTriangle()
-	t.flags = file_read_u16(fp)
-	t.v_1 = file_read_u16(fp)
-	t.v_2 = file_read_u16(fp)
-	t.v_3 = file_read_u16(fp)
-	
-	vns_1x = file_read_float(fp)
-	vns_1y = file_read_float(fp)
-	vns_1z = file_read_float(fp)
-	t.vn1 = (vns_1x, vns_1y, vns_1z)
-	
-	vns_2x = file_read_float(fp)
-	vns_2y = file_read_float(fp)
-	vns_2z = file_read_float(fp)
-	t.vn2 = (vns_2x, vns_2y, vns_2z)
-	
-	vns_3x = file_read_float(fp)
-	vns_3y = file_read_float(fp)
-	vns_3z = file_read_float(fp)
-	t.vn3 = (vns_3x, vns_3y, vns_3z)
-
-	u1 = file_read_float(fp)
-	u2 = file_read_float(fp)
-	u3 = file_read_float(fp)
-
-	v1 = file_read_float(fp)
-	v2 = file_read_float(fp)
-	v3 = file_read_float(fp)
-	t.uv1 = (u1,v1)
-	t.uv2 = (u2,v2)
-	t.uv3 = (u3,v3)
-
-	t.sg = file_read_u8(fp)           ## 1 - 32 (smoothing group)
-	t.g_idx = file_read_u8(fp)        ## group index
-	
-	return t
+def ms3d_triangles_t(fp, num_triangles):
+	triangles = []
+	## Corners sharing a vertex mostly have the same normal and uv, those
+	## triangles share the tuples too. Only bit for bit equal tuples are
+	## shared: equal floats are the same bits except 0.0 and -0.0, so a
+	## tuple holding a zero is looked up by its packed bits instead.
+	## (NaN is not equal to anything, tuples with it are never shared.)
+	shared = {}
+	share = shared.setdefault
+	key3 = SHARE_KEY_3.pack
+	key2 = SHARE_KEY_2.pack
+	data = file_read_block(fp, num_triangles * TRIANGLE_STRUCT.size)
+	for tv in TRIANGLE_STRUCT.iter_unpack(data):
+		t = MS3DTriangle()
+		t.flags = tv[0]
+		t.v_1 = tv[1]
+		t.v_2 = tv[2]
+		t.v_3 = tv[3]
+		vn = tv[4:7]
+		t.vn1 = share(key3(*vn) if 0.0 in vn else vn, vn)
+		vn = tv[7:10]
+		t.vn2 = share(key3(*vn) if 0.0 in vn else vn, vn)
+		vn = tv[10:13]
+		t.vn3 = share(key3(*vn) if 0.0 in vn else vn, vn)
+		## u1, u2, u3 then v1, v2, v3
+		uv = (tv[13], tv[16])
+		t.uv1 = share(key2(*uv) if 0.0 in uv else uv, uv)
+		uv = (tv[14], tv[17])
+		t.uv2 = share(key2(*uv) if 0.0 in uv else uv, uv)
+		uv = (tv[15], tv[18])
+		t.uv3 = share(key2(*uv) if 0.0 in uv else uv, uv)
+		t.sg = tv[19]           ## 1 - 32 (smoothing group)
+		t.g_idx = tv[20]        ## group index
+		triangles.append(t)
+	return triangles
 	
 
 ##
 ## Groups
 ##
+def ms3d_groups_t(fp, num_groups):
+	groups = []
+	for i in range(0, num_groups):
+		g = ms3d_group_t(fp)
+		groups.append(g)
+	return groups
+
 def ms3d_group_t(fp):
 	g = MS3DGroup()
-	g.flags = file_read_u8(fp)
-	g.name = file_read_str(fp, 32)
-	numtriangles = file_read_u16(fp)
-	g.triangles = []
-	for i in range(0, numtriangles):
-		tri_idx = file_read_u16(fp)
-		g.triangles.append(tri_idx)
-	g.mat_index = file_read_s8(fp)              ## -1 = no material
+	(flags, name, numtriangles) = GROUP_STRUCT.unpack(file_read_block(fp, GROUP_STRUCT.size))
+	g.flags = flags
+	g.name = bytes_str(name)
+	## triangle indices followed by the material index
+	gv = struct.unpack("<%dHb" % numtriangles, file_read_block(fp, numtriangles * 2 + 1))
+	g.triangles = list(gv[0:numtriangles])
+	g.mat_index = gv[numtriangles]              ## -1 = no material
 	
 	return g
 
@@ -266,100 +672,98 @@ def ms3d_group_t(fp):
 ##
 ## Materials
 ##
-def ms3d_material_t(fp):
-	mat = MS3DMaterial()
-	mat.name = file_read_str(fp, 32)
-	am_r = file_read_float(fp)
-	am_g = file_read_float(fp)
-	am_b = file_read_float(fp)
-	am_a = file_read_float(fp)
-	mat.ambient = (am_r, am_g, am_b, am_a)
-
-	df_r = file_read_float(fp)
-	df_g = file_read_float(fp)
-	df_b = file_read_float(fp)
-	df_a = file_read_float(fp)
-	mat.diffuse = (df_r, df_g, df_b, df_a)
-
-	sp_r = file_read_float(fp)
-	sp_g = file_read_float(fp)
-	sp_b = file_read_float(fp)
-	sp_a = file_read_float(fp)
-	mat.specular = (sp_r, sp_g, sp_b, sp_a)
-
-	em_r = file_read_float(fp)
-	em_g = file_read_float(fp)
-	em_b = file_read_float(fp)
-	em_a = file_read_float(fp)
-	mat.emissive = (em_r, em_g, em_b, em_a)
-
-	mat.shininess = file_read_float(fp)                          ## 0.0f - 128.0f
-	mat.transparency = file_read_float(fp)                       ## 0.0f - 1.0f
-	mat.mode = file_read_s8(fp)                     ## 0, 1, 2 is unused now
-	mat.imagemap = file_read_str(fp, 128)                       ## Texture file name
-	mat.alphamap = file_read_str(fp, 128)                       ## Alpha map file name
-	return mat
+def ms3d_materials_t(fp, num_materials):
+	materials = []
+	data = file_read_block(fp, num_materials * MATERIAL_STRUCT.size)
+	for mv in MATERIAL_STRUCT.iter_unpack(data):
+		mat = MS3DMaterial()
+		mat.name = bytes_str(mv[0])
+		mat.ambient = mv[1:5]
+		mat.diffuse = mv[5:9]
+		mat.specular = mv[9:13]
+		mat.emissive = mv[13:17]
+		mat.shininess = mv[17]                  ## 0.0f - 128.0f
+		mat.transparency = mv[18]               ## 0.0f - 1.0f
+		mat.mode = mv[19]                       ## 0, 1, 2 is unused now
+		mat.imagemap = bytes_str(mv[20])        ## Texture file name
+		mat.alphamap = bytes_str(mv[21])        ## Alpha map file name
+		materials.append(mat)
+	return materials
+
 
+##
+## Keyframer data
+##
+def ms3d_anim_t(fp):
+	## animation_fps, current_time, total_frames, 12 bytes
+	return ANIM_STRUCT.unpack(file_read_block(fp, ANIM_STRUCT.size))
+
+
+##
+## Joints
+##
+def ms3d_joints_t(fp, num_joints):
+	joints = []
+	for i in range(0, num_joints):
+		j = ms3d_joint_t(fp)
+		joints.append(j)
+	return joints
 
 def ms3d_joint_t(fp):
 	j = MS3DJoint()
-	j.flags = file_read_u8(fp)
-	j.jointname = file_read_str(fp, 32)
-	j.parentname = file_read_str(fp, 32)
-	
-	rot_x = file_read_float(fp)
-	rot_y = file_read_float(fp)
-	rot_z = file_read_float(fp)
-	j.rot = (rot_x, rot_y, rot_z)
-	
-	pos_x = file_read_float(fp)
-	pos_y = file_read_float(fp)
-	pos_z = file_read_float(fp)
-	j.pos = (pos_x, pos_y, pos_z)
-
-	num_key_frames_rot = file_read_u16(fp)
-	num_key_frames_trans = file_read_u16(fp)
-	
-	j.key_frames_rot = []
-	for i in range(0, num_key_frames_rot):
-		time = file_read_float(fp)                               # time in seconds
-		r_x = file_read_float(fp)
-		r_y = file_read_float(fp)
-		r_z = file_read_float(fp)
-		j.key_frames_rot.append((time, r_x,r_y,r_z))
-	
-	j.key_frames_pos = []
-	for i in range(0, num_key_frames_trans):
-		time = file_read_float(fp)                               ## time in seconds
-		p_x = file_read_float(fp)
-		p_y = file_read_float(fp)
-		p_z = file_read_float(fp)
-		j.key_frames_pos.append((time, p_x,p_y,p_z))
+	jv = JOINT_STRUCT.unpack(file_read_block(fp, JOINT_STRUCT.size))
+	j.flags = jv[0]
+	j.jointname = bytes_str(jv[1])
+	j.parentname = bytes_str(jv[2])
+	j.rot = jv[3:6]
+	j.pos = jv[6:9]
+	num_key_frames_rot = jv[9]
+	num_key_frames_trans = jv[10]
+	
+	## time in seconds, x, y, z
+	data = file_read_block(fp, num_key_frames_rot * KEYFRAME_STRUCT.size)
+	j.key_frames_rot = list(KEYFRAME_STRUCT.iter_unpack(data))
+	
+	data = file_read_block(fp, num_key_frames_trans * KEYFRAME_STRUCT.size)
+	j.key_frames_pos = list(KEYFRAME_STRUCT.iter_unpack(data))
 	return j
 
 
 ##
-## Group comments
+## Comments
 ##
+def ms3d_comments_t(fp):
+	comments = MS3DFileComments()
+	comments.group_comments = ms3d_comment_list_t(fp)
+	comments.material_comments = ms3d_comment_list_t(fp)
+	comments.joint_comments = ms3d_comment_list_t(fp)
+	comments.model_comment = ms3d_comment_list_t(fp)
+	return comments
+
+def ms3d_comment_list_t(fp):
+	cl = []
+	num_comments = file_read_u32(fp) ## 4 bytes
+	for i in range(0, num_comments):
+		c = ms3d_comment_t(fp)
+		cl.append(c)
+	return cl
+
 def ms3d_comment_t(fp):
-	index = file_read_u32(fp)         ## index of group, material or joint
-	clen = file_read_u32(fp)          ## length of comment
+	## index of group, material or joint, length of comment
+	(index, clen) = COMMENT_STRUCT.unpack(file_read_block(fp, COMMENT_STRUCT.size))
 	comment = file_read_str(fp, clen) ## comment
 	return (index, comment)
 	
 
 def ms3d_extra(fp, num_vertices, num_joints):
 	
-	extra_vs = []
 	sub_version = file_read_u32_maybe(fp)
 	if sub_version == None:
 		return (None, None, None)
 		
 	## print("sub_version vs=" + str(sub_version))
 	if sub_version > 0 and sub_version < 4:
-		for i in range(0, num_vertices):
-			ex = ms3d_vertex_ex_t(fp, sub_version)
-			extra_vs.append(ex)
+		extra_vs = ms3d_vertices_ex_t(fp, sub_version, num_vertices)
 	else:
 		return (None, None, None)
 	
@@ -385,28 +789,31 @@ def ms3d_extra(fp, num_vertices, num_joints):
 	return (extra_vs, extra_jn, extra_md)
 
 
-def ms3d_vertex_ex_t(fp, sub_version):
-	vex = MS3DVertex_ex()
-	vex.bone_id1 = file_read_s8(fp)
-	vex.bone_id2 = file_read_s8(fp)
-	vex.bone_id3 = file_read_s8(fp)             ## index of joint or -1
-	vex.weight1 = file_read_u8(fp) / 100.0
-	vex.weight2 = file_read_u8(fp) / 100.0
-	vex.weight3 = file_read_u8(fp) / 100.0
-	
-	vex.extra1 = 0
-	vex.extra2 = 0
-	## vertex extra
-	if sub_version == 1:
-		pass
-	elif sub_version == 2:
-		# for subversion == 2
-		vex.extra1 = file_read_u32(fp)
-	elif sub_version == 3:
-		# for subversion == 3
-		vex.extra1 = file_read_u32(fp)
-		vex.extra2 = file_read_u32(fp)
-	return vex
+def ms3d_vertices_ex_t(fp, sub_version, num_vertices):
+	vex_struct = VERTEX_EX_STRUCTS[sub_version]
+	extra_vs = []
+	data = file_read_block(fp, num_vertices * vex_struct.size)
+	for exv in vex_struct.iter_unpack(data):
+		vex = MS3DVertex_ex()
+		vex.bone_id1 = exv[0]
+		vex.bone_id2 = exv[1]
+		vex.bone_id3 = exv[2]             ## index of joint or -1
+		vex.weight1 = exv[3] / 100.0
+		vex.weight2 = exv[4] / 100.0
+		vex.weight3 = exv[5] / 100.0
+		
+		vex.extra1 = 0
+		vex.extra2 = 0
+		## vertex extra
+		if sub_version == 2:
+			# for subversion == 2
+			vex.extra1 = exv[6]
+		elif sub_version == 3:
+			# for subversion == 3
+			vex.extra1 = exv[6]
+			vex.extra2 = exv[7]
+		extra_vs.append(vex)
+	return extra_vs
 	
 
 ## for subVersion == 1
@@ -416,9 +823,10 @@ def ms3d_joint_ex_t(fp, sub_version):
 	exj.col_g = 0.8
 	exj.col_b = 0.8
 	if sub_version >= 1:
-		exj.col_r = file_read_float(fp)
-		exj.col_g = file_read_float(fp)
-		exj.col_b = file_read_float(fp)
+		(col_r, col_g, col_b) = JOINT_EX_STRUCT.unpack(file_read_block(fp, JOINT_EX_STRUCT.size))
+		exj.col_r = col_r
+		exj.col_g = col_g
+		exj.col_b = col_b
 	return exj
 	
 
@@ -429,9 +837,10 @@ def ms3d_model_ex_t(fp, sub_version):
 	exm.transparencymode = 0
 	exm.alpharef = 1.0
 	if sub_version >= 1:
-		exm.jointsize = file_read_float(fp)	## joint size, since subVersion == 1
-		exm.transparencymode = file_read_u32(fp)
-		exm.alpharef = file_read_float(fp)
+		(jointsize, transparencymode, alpharef) = MODEL_EX_STRUCT.unpack(file_read_block(fp, MODEL_EX_STRUCT.size))
+		exm.jointsize = jointsize	## joint size, since subVersion == 1
+		exm.transparencymode = transparencymode
+		exm.alpharef = alpharef
 	return exm
 
 
@@ -440,13 +849,29 @@ def ms3d_model_ex_t(fp, sub_version):
 ## Read Milkshape 3D Text files
 ##
 
-def read_ms3d_txt_file(flname):
-	fp = open(flname, "r", encoding="utf-8")
+def read_ms3d_txt_file(flname, workers=None):
+	(meshes, materials) = read_ms3d_txt_meshes(flname, workers)
+	ms3df = MS3DFile()
+	ms3df.materials = materials
+	mh = MeshHelper()
+	mh.meshes = meshes
+	mh.set(ms3df)
+	return ms3df
+
+def read_ms3d_txt_meshes(flname, workers=None):
+	## The meshes as they are in the file, for callers that work with
+	## per mesh data anyway
+	
+	## Read the whole file in one go and hand out its lines
+	fp = open_ms3d_file(flname, "r")
+	all_lines = fp.read().splitlines()
+	lines = iter(all_lines)
+	fp.close()
 	meshes = []
 	materials = []
 	
 	while True:
-		[section_name, num] = read_txt_line_section(fp)
+		[section_name, num] = read_txt_line_section(lines)
 		if section_name == "eof":
 			break
 		section_name = section_name.lower()
@@ -456,82 +881,140 @@ def read_ms3d_txt_file(flname):
 			frame_number = num  ## Current frame
 		if section_name == "meshes":
 			num_meshes = num  ## Number of meshes
-			for m_i in range(0, num_meshes):
-				m = read_txt_mesh(fp, num_meshes)
-				meshes.append(m)
+			if use_workers(workers):
+				meshes.extend(read_txt_meshes_parallel(all_lines, lines, num_meshes, workers))
+			else:
+				for m_i in range(0, num_meshes):
+					m = read_txt_mesh(lines, num_meshes)
+					meshes.append(m)
 		if section_name == "materials":
 			## Number of materials
 			num_materials = num
 			for m_i in range(0, num_materials):
-				m = read_txt_material(fp, num_materials)
+				m = read_txt_material(lines, num_materials)
 				materials.append(m)
 		if section_name == "bones":
 			## Number of joints
 			num_bones = num
 			for m_i in range(0, num_bones):
-				read_txt_bone(fp, num_bones)
+				read_txt_bone(lines, num_bones)
 		if section_name == "groupcomments":
 			num_group_comments = num
 			for m_i in range(0, num_group_comments):
-				read_txt_group_comment(fp, num_group_comments)
+				read_txt_group_comment(lines, num_group_comments)
 		if section_name == "materialcomments":
 			num_material_comments = num
 			for m_i in range(0, num_material_comments):
-				read_txt_material_comment(fp, num_material_comments)
+				read_txt_material_comment(lines, num_material_comments)
 		if section_name == "bonecomments":
 			num_bone_comments = num
 			for m_i in range(0, num_bone_comments):
-				read_txt_bone_comment(fp, num_bone_comments)
+				read_txt_bone_comment(lines, num_bone_comments)
 		if section_name == "modelcomment":
 			num_model_comment = num
 			for m_i in range(0, num_model_comment):
-				read_txt_model_comment(fp, num_model_comment)
-	ms3df = MS3DFile()
-	ms3df.materials = materials
-	mh = MeshHelper()
-	mh.meshes = meshes
-	mh.set(ms3df)
-	return ms3df
+				read_txt_model_comment(lines, num_model_comment)
+	return (meshes, materials)
 	
 
 
-def read_txt_header(fp):
-	line_0 = fp.readline()
+##
+## Each mesh is self contained, so after finding the lines of every
+## mesh they are parsed in a process pool and collected in file order.
+##
+def read_txt_meshes_parallel(all_lines, lines, num_meshes, workers):
+	blocks = []
+	for m_i in range(0, num_meshes):
+		## lines is an iterator over all_lines, what it has left gives
+		## the position
+		start = len(all_lines) - length_hint(lines)
+		skip_txt_mesh(lines)
+		end = len(all_lines) - length_hint(lines)
+		blocks.append("\n".join(all_lines[start:end]))
+	pool = ProcessPoolExecutor(max_workers=workers)
+	meshes = list(pool.map(read_txt_mesh_block, blocks))
+	pool.shutdown()
+	return meshes
+
+def read_txt_mesh_block(text):
+	return read_txt_mesh(iter(text.splitlines()), 1)
+
+
+##
+## Streaming reads. The file is read line by line and only the mesh
+## being handed out is held in memory.
+##
+
+def iter_ms3d_txt_meshes(flname):
+	fp = open_ms3d_file(flname, "r")
+	try:
+		while True:
+			[section_name, num] = read_txt_line_section(fp)
+			if section_name == "eof":
+				break
+			section_name = section_name.lower()
+			if section_name == "meshes":
+				for m_i in range(0, num):
+					yield read_txt_mesh(fp, num)
+				break
+			if section_name == "materials":
+				for m_i in range(0, num):
+					read_txt_material(fp, num)
+			if section_name == "bones":
+				for m_i in range(0, num):
+					read_txt_bone(fp, num)
+	finally:
+		fp.close()
+
+def read_ms3d_txt_materials(flname):
+	## Meshes are skipped over without converting their rows
+	fp = open_ms3d_file(flname, "r")
+	materials = []
+	try:
+		while True:
+			[section_name, num] = read_txt_line_section(fp)
+			if section_name == "eof":
+				break
+			section_name = section_name.lower()
+			if section_name == "meshes":
+				for m_i in range(0, num):
+					skip_txt_mesh(fp)
+			if section_name == "materials":
+				for m_i in range(0, num):
+					materials.append(read_txt_material(fp, num))
+				break
+			if section_name == "bones":
+				for m_i in range(0, num):
+					read_txt_bone(fp, num)
+	finally:
+		fp.close()
+	return materials
+
+
+def read_txt_header(lines):
+	line_0 = next(lines, "")
 	line_1 = line_0.strip().lower()
 	return line_1 == "// milkshape 3d ascii"
 
 
-def read_txt_mesh(fp, num_meshes):
+def read_txt_mesh(lines, num_meshes):
 	## Mesh name, flags, material index
-	[meshname, meshflags, materialindex] = read_txt_line(fp, "sii")
-	
-	vertices = []
-	normals = []
-	trianglefaces = []
+	[meshname, meshflags, materialindex] = read_txt_line(lines, "sii")
 	
 	## Number of vertices
-	vs = []
-	[num_lines_1] = read_txt_line(fp, "i")
-	for i in range(0, num_lines_1):
-		## Vertex flags, x, y, z, u, v, bone index
-		[flags, v_x,v_y,v_z, u,v, bindex] = read_txt_line(fp, "ifffffi")
-		vertices.append((flags, v_x,v_y,v_z, u,v, bindex))
+	[num_lines_1] = read_txt_line(lines, "i")
+	## Vertex flags, x, y, z, u, v, bone index
+	vertices = read_txt_rows(lines, num_lines_1, "ifffffi")
 	
 	## Number of normals
-	ns = []
-	[num_lines_2] = read_txt_line(fp, "i")
-	for i in range(0, num_lines_2):
-		## Normal x, y, z
-		[nrm_x, nrm_y, nrm_z] = read_txt_line(fp, "fff")
-		normals.append((nrm_x, nrm_y, nrm_z))
+	[num_lines_2] = read_txt_line(lines, "i")
+	## Normal x, y, z
+	normals = read_txt_rows(lines, num_lines_2, "fff")
 	
 	## Number of triangles
-	tris = []
-	[num_lines_3] = read_txt_line(fp, "i")
-	for i in range(0, num_lines_3):
-		## Triangle flags, vertex index1, vertex index2, vertex index3, normal index1, normal index 2, normal index 3, smoothing group
-		[flags,v1,v2,v3,n1,n2,n3,sg] = read_txt_line(fp, "iiiiiiii")
-		trianglefaces.append((flags,v1,v2,v3,n1,n2,n3,sg))
+	[num_lines_3] = read_txt_line(lines, "i")
+	## Triangle flags, vertex index1, vertex index2, vertex index3, normal index1, normal index 2, normal index 3, smoothing group
+	trianglefaces = read_txt_rows(lines, num_lines_3, "iiiiiiii")
 		
 	m = Mesh()
 	m.meshname = meshname
@@ -546,38 +1029,58 @@ def read_txt_mesh(fp, num_meshes):
 
 
 
-def read_txt_material(fp, num_materials):
+def skip_txt_mesh(lines):
+	## Mesh name, flags, material index
+	read_txt_line(lines, "sii")
+	for i in range(0, 3):
+		## Number of vertices, normals and triangles then their rows
+		[num_lines] = read_txt_line(lines, "i")
+		skip_txt_rows(lines, num_lines)
+
+
+def skip_txt_rows(lines, num_lines):
+	skipped = 0
+	while skipped < num_lines:
+		chunk = list(islice(lines, num_lines - skipped))
+		if len(chunk) == 0:
+			raise Exception("EOF")
+		for line_0 in chunk:
+			if strip_comments(line_0).strip() != "":
+				skipped = skipped + 1
+
+
+def read_txt_material(lines, num_materials):
 
 	## Material name
-	[materialname] = read_txt_line(fp, "s")
+	[materialname] = read_txt_line(lines, "s")
 
 	## Ambient
-	[am_r, am_g, am_b, am_a] = read_txt_line(fp, "ffff")
+	[am_r, am_g, am_b, am_a] = read_txt_line(lines, "ffff")
 	ambient = (am_r, am_g, am_b, am_a)
 
 	## Diffuse
-	[df_r, df_g, df_b, df_a] = read_txt_line(fp, "ffff")
+	[df_r, df_g, df_b, df_a] = read_txt_line(lines, "ffff")
 	diffuse = (df_r, df_g, df_b, df_a)
 
 	## Specular
-	[sp_r, sp_g, sp_b, sp_a] = read_txt_line(fp, "ffff")
+	[sp_r, sp_g, sp_b, sp_a] = read_txt_line(lines, "ffff")
 	specular = (sp_r, sp_g, sp_b, sp_a)
 
 	## Emissive
-	[em_r, em_g, em_b, em_a] = read_txt_line(fp, "ffff")
+	[em_r, em_g, em_b, em_a] = read_txt_line(lines, "ffff")
 	emissive = (em_r, em_g, em_b, em_a)
 
 	## Shininess
-	[shininess] = read_txt_line(fp, "f")
+	[shininess] = read_txt_line(lines, "f")
 
 	## Transparency
-	[transparency] = read_txt_line(fp, "f")
+	[transparency] = read_txt_line(lines, "f")
 
 	## Texture map
-	[colormap] = read_txt_line(fp, "s")
+	[colormap] = read_txt_line(lines, "s")
 
 	## Alpha map
-	[alphamap] = read_txt_line(fp, "s")
+	[alphamap] = read_txt_line(lines, "s")
 
 	mat = MS3DMaterial()
 	mat.name = materialname
@@ -593,31 +1096,31 @@ def read_txt_material(fp, num_materials):
 	return mat
 
 
-def read_txt_bone(fp, NumBones):
+def read_txt_bone(lines, NumBones):
 	
 	## Name
-	[joint_name] = read_txt_line(fp, "s")
+	[joint_name] = read_txt_line(lines, "s")
 
 	## Parent name
-	[parent_name] = read_txt_line(fp, "s")
+	[parent_name] = read_txt_line(lines, "s")
 
 	## Joint flags, posx, posy, posz, rotx, roty, rotz
-	[flags, pos_x, pos_y, pos_z, rot_x, rot_y, rot_z] = read_txt_line(fp, "iffffff")
+	[flags, pos_x, pos_y, pos_z, rot_x, rot_y, rot_z] = read_txt_line(lines, "iffffff")
 
 	## Number of position keys
-	[num_position_keys] = read_txt_line(fp, "i")
+	[num_position_keys] = read_txt_line(lines, "i")
 	key_frames_pos = []
 	for i in range(0, num_position_keys):
 		## Position key time, posx, posy, posz
-		[time, pos_x, pos_y, pos_z] = read_txt_line(fp, "ffff")
+		[time, pos_x, pos_y, pos_z] = read_txt_line(lines, "ffff")
 		key_frames_pos.append((time, pos_x, pos_y, pos_z))
 	
 	## Number of rotation keys
-	[num_rotation_keys] = read_txt_line(fp, "i")
+	[num_rotation_keys] = read_txt_line(lines, "i")
 	key_frames_rot = []
 	for i in range(0, num_rotation_keys):
 		## Rotation key time, rotx, roty, rotz
-		[time, rot_x, rot_y, rot_z] = read_txt_line(fp, "ffff")
+		[time, rot_x, rot_y, rot_z] = read_txt_line(lines, "ffff")
 		key_frames_rot.append((time, rot_x, rot_y, rot_z))
 	
 	joint = MS3DJoint()
@@ -631,84 +1134,135 @@ def read_txt_bone(fp, NumBones):
 	return joint
 
 
-def read_txt_group_comment(fp, NumGroupComments):
+def read_txt_group_comment(lines, NumGroupComments):
 	return None
 
 
-def read_txt_material_comment(fp, NumMaterialComments):
+def read_txt_material_comment(lines, NumMaterialComments):
 	return None
 
 
-def read_txt_bone_comment(fp, NumBoneComments):
+def read_txt_bone_comment(lines, NumBoneComments):
 	return None
 
 
-def read_txt_model_comment(fp, NumModelComment):
+def read_txt_model_comment(lines, NumModelComment):
 	return None
 
 
-def read_txt_line_section(fp):
-	line_0 = fp.readline()
-	if line_0 == "":
-		return ["eof", 0]
-	line_1 = strip_comments(line_0).strip()
-	while line_1 == "":
-		line_0 = fp.readline()
-		if line_0 == "":
-			return ["eof", 0]
+def read_txt_next_line(lines):
+	## Next line that is not empty once comments are removed
+	for line_0 in lines:
 		line_1 = strip_comments(line_0).strip()
+		if line_1 != "":
+			return line_1
+	return None
+
+def read_txt_line_section(lines):
+	line_1 = read_txt_next_line(lines)
+	if line_1 == None:
+		return ["eof", 0]
 	[section_name, int_number_s] = line_1.split(":")
 	return [section_name, int(int_number_s)]
 
-def read_txt_line(fp, types):
-	line_0 = fp.readline()
-	line_1 = strip_comments(line_0).strip()
-	while line_1 == "":
-		line_0 = fp.readline()
+def read_txt_line(lines, types):
+	line_1 = read_txt_next_line(lines)
+	if line_1 == None:
+		raise Exception("EOF")
+	return txt_line_converter(types)(line_1)
+
+
+##
+## A block of num_lines rows that all have the same layout, converted a
+## column at a time. Falls back to converting line by line when the block
+## has comments, blank lines or rows of a different length.
+##
+def read_txt_rows(lines, num_lines, types):
+	if num_lines == 0:
+		return []
+	row_len = len(types)
+	chunk = list(islice(lines, num_lines))
+	if numpy != None:
+		try:
+			rows = numpy.loadtxt(chunk, dtype=txt_row_dtype(types), comments="//", ndmin=1).tolist()
+		except ValueError:
+			rows = None
+		if rows != None and len(rows) == num_lines:
+			return rows
+	
+	text = "\n".join(chunk)
+	if not "//" in text:
+		toks = text.split()
+		if len(toks) == num_lines * row_len:
+			cols = []
+			for k in range(0, row_len):
+				cols.append(map(TXT_CONVERT[types[k]], toks[k::row_len]))
+			return list(zip(*cols))
+	
+	rows = []
+	for line_0 in chunk:
 		line_1 = strip_comments(line_0).strip()
-	type_vals = []
-	i2 = 0
-	for t in types:
-		## Advance until a non space character
-		while (line_1[i2] == ' ') or (line_1[i2] == '\t'):
-			i2 = i2 + 1
-		if t == "s":
-			if line_1[i2] == '"':
-				i2b = i2 + 1
-				i2 = i2 + 1
-				while line_1[i2] != '"':
-					i2 = i2 + 1
-				strval = line_1[i2b:i2]
-				type_vals.append(strval)
-				i2 = i2 + 1
-		
-		elif t == "i":
-			i2b = i2
-			i2 = i2 + 1
-			while i2 < len(line_1) and (line_1[i2] != ' ') and (line_1[i2] != '\t'):
-				i2 = i2 + 1
-			strval = line_1[i2b:i2]
-			type_vals.append(int(strval))
-		
-		elif t == "f":
-			i2b = i2
-			i2 = i2 + 1
-			while i2 < len(line_1) and (line_1[i2] != ' ') and (line_1[i2] != '\t'):
-				i2 = i2 + 1
-			strval = line_1[i2b:i2]
-			type_vals.append(float(strval))
-	return type_vals
+		if line_1 != "":
+			rows.append(line_1)
+	while len(rows) < num_lines:
+		line_1 = read_txt_next_line(lines)
+		if line_1 == None:
+			raise Exception("EOF")
+		rows.append(line_1)
+	conv = txt_line_converter(types)
+	return [tuple(conv(line_1)) for line_1 in rows]
+
+
+##
+## Line converters, one per format string such as "ifffffi", are made
+## once and kept in txt_converters.
+##
+TXT_CONVERT = {"s": str, "i": int, "f": float}
+TXT_TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+txt_converters = {}
+txt_row_dtypes = {}
+
+def txt_row_dtype(types):
+	## numpy record type for a row of numbers, tolist() of an array of
+	## these gives the same tuples as the converters.
+	if not types in txt_row_dtypes:
+		fields = []
+		for k in range(0, len(types)):
+			if types[k] == "i":
+				fields.append(("c%d" % k, numpy.int64))
+			else:
+				fields.append(("c%d" % k, numpy.float64))
+		txt_row_dtypes[types] = numpy.dtype(fields)
+	return txt_row_dtypes[types]
+
+def txt_line_converter(types):
+	if types in txt_converters:
+		return txt_converters[types]
+	fns = [TXT_CONVERT[t] for t in types]
+	if "s" in types:
+		## Quoted strings may contain spaces
+		def conv(line_1):
+			return [fn(tok) for (fn, tok) in zip(fns, txt_tokens(line_1))]
+	else:
+		def conv(line_1):
+			return [fn(tok) for (fn, tok) in zip(fns, line_1.split())]
+	txt_converters[types] = conv
+	return conv
+
+def txt_tokens(line_1):
+	toks = []
+	for m in TXT_TOKEN_RE.finditer(line_1):
+		(quoted, tok) = m.groups()
+		if quoted != None:
+			toks.append(quoted)
+		else:
+			toks.append(tok)
+	return toks
 	
 	
 ## Remove comments
 def strip_comments(line_0):
-	i2 = 0
-	i2l = len(line_0)
-	while True:
-		if i2+1 >= i2l:
-			return line_0
-		if (line_0[i2] == '/') and (line_0[i2+1] == '/'):
-			ret = line_0[0:i2]
-			return ret
-		i2 = i2 + 1
-
+	i2 = line_0.find("//")
+	if i2 < 0:
+		return line_0
+	return line_0[0:i2]
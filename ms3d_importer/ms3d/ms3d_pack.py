@@ -0,0 +1,251 @@
+##
+##  Compact binary snapshot of a MS3DFile
+##
+##  Copyright 2023 Edward Blake
+##
+##  See the file "LICENSE" for information on usage and redistribution
+##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
+##
+
+import marshal
+from array import array
+from ms3d.ms3d_cls import MS3DFileComments, MS3DFile, MS3DVertex, MS3DTriangle, MS3DGroup, MS3DMaterial, MS3DJoint, MS3DVertex_ex, MS3DJoint_ex, MS3DModel_ex
+
+##
+## The per vertex, per triangle and per key frame values are kept in
+## array columns written out as raw bytes, everything else is small and
+## goes through marshal as plain tuples. Each column keeps its array
+## typecode: integers take the type of the field in the binary records
+## (u8, s8, u16), floats are float32 unless a value would change by it
+## (text files are read as doubles).
+##
+PACK_MAGIC = b"MS3DPACK"
+PACK_VERSION = 2
+
+
+def pack_ms3d_file(ms3df):
+	vertices = ms3df.vertices
+	triangles = ms3df.triangles
+
+	cols = {}
+	cols["v_flags"] = int_column('B', [v.flags for v in vertices])
+	cols["v_xyz"] = float_column([c for v in vertices for c in (v.v_x, v.v_y, v.v_z)])
+	cols["v_bone_id"] = int_column('b', [v.bone_id for v in vertices])
+	cols["v_ref_count"] = int_column('B', [v.ref_count for v in vertices])
+
+	cols["t_flags"] = int_column('H', [t.flags for t in triangles])
+	cols["t_idx"] = int_column('H', [c for t in triangles for c in (t.v_1, t.v_2, t.v_3)])
+	cols["t_vn"] = float_column([c for t in triangles for c in t.vn1 + t.vn2 + t.vn3])
+	cols["t_uv"] = float_column([c for t in triangles for c in t.uv1 + t.uv2 + t.uv3])
+	cols["t_sg"] = int_column('B', [t.sg for t in triangles])
+	cols["t_g_idx"] = int_column('B', [t.g_idx for t in triangles])
+
+	groups = []
+	for g in ms3df.groups:
+		groups.append((g.flags, g.name, int_column('H', g.triangles), g.mat_index))
+
+	materials = []
+	for m in ms3df.materials:
+		materials.append((m.name, m.ambient, m.diffuse, m.specular, m.emissive,
+			m.shininess, m.transparency, m.mode, m.imagemap, m.alphamap))
+
+	joints = []
+	keys = []
+	for j in ms3df.joints:
+		joints.append((j.flags, j.jointname, j.parentname, j.rot, j.pos,
+			len(j.key_frames_rot), len(j.key_frames_pos)))
+		for k in j.key_frames_rot:
+			keys.extend(k)
+		for k in j.key_frames_pos:
+			keys.extend(k)
+	cols["keys"] = float_column(keys)
+
+	comments = None
+	if ms3df.comments != None:
+		c = ms3df.comments
+		comments = (c.group_comments, c.material_comments, c.joint_comments, c.model_comment)
+
+	extra = None
+	if ms3df.extra != None:
+		(ex_vs, ex_jn, ex_md) = ms3df.extra
+		if ex_vs != None:
+			cols["x_bone_ids"] = int_column('b', [c for x in ex_vs for c in (x.bone_id1, x.bone_id2, x.bone_id3)])
+			cols["x_weights"] = percent_column([c for x in ex_vs for c in (x.weight1, x.weight2, x.weight3)])
+			cols["x_extras"] = int_column('I', [c for x in ex_vs for c in (x.extra1, x.extra2)])
+			ex_vs = len(ex_vs)
+		if ex_jn != None:
+			ex_jn = [(x.col_r, x.col_g, x.col_b) for x in ex_jn]
+		if ex_md != None:
+			ex_md = (ex_md.jointsize, ex_md.transparencymode, ex_md.alpharef)
+		extra = (ex_vs, ex_jn, ex_md)
+
+	meta = (len(vertices), len(triangles), groups, materials, ms3df.anim, joints, comments, extra)
+	return PACK_MAGIC + marshal.dumps((PACK_VERSION, meta, cols))
+
+
+def unpack_ms3d_file(data):
+	if data[0:len(PACK_MAGIC)] != PACK_MAGIC:
+		raise ValueError("Not a ms3d pack")
+	(version, meta, cols) = marshal.loads(data[len(PACK_MAGIC):])
+	if version != PACK_VERSION:
+		raise ValueError("Unsupported ms3d pack version")
+	(num_vertices, num_triangles, groups, materials, anim, joints, comments, extra) = meta
+
+	msf = MS3DFile()
+
+	it = iter(column(cols["v_xyz"]))
+	for (flags, v_x, v_y, v_z, bone_id, ref_count) in zip(column(cols["v_flags"]), it, it, it,
+			column(cols["v_bone_id"]), column(cols["v_ref_count"])):
+		v = MS3DVertex()
+		v.flags = flags
+		v.v_x = v_x
+		v.v_y = v_y
+		v.v_z = v_z
+		v.bone_id = bone_id
+		v.ref_count = ref_count
+		msf.vertices.append(v)
+
+	it = iter(column(cols["t_idx"]))
+	idx = zip(it, it, it)
+	it = iter(column(cols["t_vn"]))
+	it = iter(zip(it, it, it))
+	vns = zip(it, it, it)
+	it = iter(column(cols["t_uv"]))
+	it = iter(zip(it, it))
+	uvs = zip(it, it, it)
+	for (flags, (v_1, v_2, v_3), (vn1, vn2, vn3), (uv1, uv2, uv3), sg, g_idx) in zip(
+			column(cols["t_flags"]), idx, vns, uvs,
+			column(cols["t_sg"]), column(cols["t_g_idx"])):
+		t = MS3DTriangle()
+		t.flags = flags
+		t.v_1 = v_1
+		t.v_2 = v_2
+		t.v_3 = v_3
+		t.vn1 = vn1
+		t.vn2 = vn2
+		t.vn3 = vn3
+		t.uv1 = uv1
+		t.uv2 = uv2
+		t.uv3 = uv3
+		t.sg = sg
+		t.g_idx = g_idx
+		msf.triangles.append(t)
+
+	for (flags, name, tris, mat_index) in groups:
+		g = MS3DGroup()
+		g.flags = flags
+		g.name = name
+		g.triangles = column(tris).tolist()
+		g.mat_index = mat_index
+		msf.groups.append(g)
+
+	for (name, ambient, diffuse, specular, emissive, shininess, transparency, mode, imagemap, alphamap) in materials:
+		m = MS3DMaterial()
+		m.name = name
+		m.ambient = ambient
+		m.diffuse = diffuse
+		m.specular = specular
+		m.emissive = emissive
+		m.shininess = shininess
+		m.transparency = transparency
+		m.mode = mode
+		m.imagemap = imagemap
+		m.alphamap = alphamap
+		msf.materials.append(m)
+
+	msf.anim = anim
+
+	it = iter(column(cols["keys"]))
+	keys = zip(it, it, it, it)
+	for (flags, jointname, parentname, rot, pos, num_rot, num_pos) in joints:
+		j = MS3DJoint()
+		j.flags = flags
+		j.jointname = jointname
+		j.parentname = parentname
+		j.rot = rot
+		j.pos = pos
+		j.key_frames_rot = [next(keys) for i in range(0, num_rot)]
+		j.key_frames_pos = [next(keys) for i in range(0, num_pos)]
+		msf.joints.append(j)
+
+	if comments != None:
+		c = MS3DFileComments()
+		(c.group_comments, c.material_comments, c.joint_comments, c.model_comment) = comments
+		msf.comments = c
+
+	if extra != None:
+		(ex_vs, ex_jn, ex_md) = extra
+		if ex_vs != None:
+			it = iter(column(cols["x_bone_ids"]))
+			bone_ids = zip(it, it, it)
+			weights = column(cols["x_weights"])
+			if weights.typecode == 'B':
+				weights = [p / 100.0 for p in weights]
+			it = iter(weights)
+			weights = zip(it, it, it)
+			it = iter(column(cols["x_extras"]))
+			extras = zip(it, it)
+			ex_vs = []
+			for ((b1, b2, b3), (w1, w2, w3), (e1, e2)) in zip(bone_ids, weights, extras):
+				x = MS3DVertex_ex()
+				x.bone_id1 = b1
+				x.bone_id2 = b2
+				x.bone_id3 = b3
+				x.weight1 = w1
+				x.weight2 = w2
+				x.weight3 = w3
+				x.extra1 = e1
+				x.extra2 = e2
+				ex_vs.append(x)
+		if ex_jn != None:
+			jn = []
+			for (col_r, col_g, col_b) in ex_jn:
+				x = MS3DJoint_ex()
+				x.col_r = col_r
+				x.col_g = col_g
+				x.col_b = col_b
+				jn.append(x)
+			ex_jn = jn
+		if ex_md != None:
+			x = MS3DModel_ex()
+			(x.jointsize, x.transparencymode, x.alpharef) = ex_md
+			ex_md = x
+		msf.extra = (ex_vs, ex_jn, ex_md)
+	return msf
+
+
+## Text files are not held to the limits of the binary records, a
+## column that does not fit its field type is kept as 64 bit integers
+def int_column(typecode, values):
+	try:
+		col = array(typecode, values)
+	except OverflowError:
+		col = array('q', values)
+	return (col.typecode, col.tobytes())
+
+def float_column(values):
+	col = array('d', values)
+	try:
+		col_f = array('f', col)
+	except OverflowError:
+		col_f = None
+	## Compared as bytes so NaN counts as unchanged
+	if col_f != None and array('d', col_f).tobytes() == col.tobytes():
+		col = col_f
+	return (col.typecode, col.tobytes())
+
+## Bone weights are whole percents in the binary file
+def percent_column(values):
+	try:
+		col = array('B', [round(w * 100.0) for w in values])
+	except (OverflowError, ValueError):
+		col = None
+	if col != None and [p / 100.0 for p in col] == values:
+		return (col.typecode, col.tobytes())
+	return float_column(values)
+
+def column(typed_data):
+	(typecode, data) = typed_data
+	col = array(typecode)
+	col.frombytes(data)
+	return col
@@ -0,0 +1,196 @@
+##
+##  MS3D Skinned Poses
+##
+##  Copyright 2023 Edward Blake
+##
+##  See the file "LICENSE" for information on usage and redistribution
+##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
+##
+
+from array import array
+from ms3d.ms3d_anim import MS3DAnimSampler, euler_to_quat
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+## Influences per vertex, the vertex bone plus the three extra bones
+MAX_INFLUENCES = 4
+
+IDENTITY = (1.0, 0.0, 0.0, 0.0,
+	0.0, 1.0, 0.0, 0.0,
+	0.0, 0.0, 1.0, 0.0)
+
+##
+## Computes the vertex positions of a MS3DFile posed by its joints.
+## The bone ids and weights of every vertex are kept as a flat weight
+## matrix with MAX_INFLUENCES entries per vertex, unused entries have
+## bone id -1 and weight 0.
+##
+## Matrices are 3x4 row major tuples of 12 floats.
+##
+class MS3DSkin:
+	def __init__(self, ms3df):
+		self.sampler = MS3DAnimSampler(ms3df)
+		self.bone_ids = array('b')
+		self.weights = array('f')
+		self.positions = array('d')
+
+		ex_vs = None
+		if ms3df.extra != None:
+			ex_vs = ms3df.extra[0]
+		i = 0
+		for v in ms3df.vertices:
+			self.positions.extend((v.v_x, v.v_y, v.v_z))
+			ex = None
+			if ex_vs != None and i < len(ex_vs):
+				ex = ex_vs[i]
+			if ex == None:
+				self.bone_ids.extend((v.bone_id, -1, -1, -1))
+				self.weights.extend((1.0, 0.0, 0.0, 0.0))
+			else:
+				self.bone_ids.extend((v.bone_id, ex.bone_id1, ex.bone_id2, ex.bone_id3))
+				if ex.weight1 == 0.0 and ex.weight2 == 0.0 and ex.weight3 == 0.0:
+					## No weights stored, the vertex bone takes it all
+					self.weights.extend((1.0, 0.0, 0.0, 0.0))
+				else:
+					## The stored weights go to the vertex bone and the first two
+					## extra bones, the third extra bone gets what is left.
+					## Normalized in case they add up to more than one.
+					w4 = max(0.0, 1.0 - ex.weight1 - ex.weight2 - ex.weight3)
+					wsum = ex.weight1 + ex.weight2 + ex.weight3 + w4
+					self.weights.extend((ex.weight1 / wsum, ex.weight2 / wsum, ex.weight3 / wsum, w4 / wsum))
+			i = i + 1
+
+		## Rest pose, parents are looked up by name
+		joints = ms3df.joints
+		index_of_joint = {}
+		for ji in range(0, len(joints)):
+			index_of_joint[joints[ji].jointname] = ji
+		self.parents = []
+		self.local_rest = []
+		for j in joints:
+			self.parents.append(index_of_joint.get(j.parentname, -1))
+			self.local_rest.append(quat_pos_matrix(euler_to_quat(j.rot), j.pos))
+		global_rest = self.global_matrices(self.local_rest)
+		self.inverse_rest = [mat_inverse(m) for m in global_rest]
+
+		if numpy != None:
+			num_vertices = len(ms3df.vertices)
+			self.np_positions = numpy.frombuffer(self.positions, dtype=numpy.float64).reshape(num_vertices, 3)
+			self.np_bone_ids = numpy.frombuffer(self.bone_ids, dtype=numpy.int8).reshape(num_vertices, MAX_INFLUENCES).astype(numpy.intp)
+			self.np_weights = numpy.frombuffer(self.weights, dtype=numpy.float32).reshape(num_vertices, MAX_INFLUENCES).astype(numpy.float64)
+			## No bone maps to an extra identity matrix at the end
+			no_bone = (self.np_bone_ids < 0) | (self.np_bone_ids >= len(joints))
+			self.np_bone_ids[no_bone] = len(joints)
+
+	def global_matrices(self, local):
+		glob = [None] * len(local)
+		for ji in range(0, len(local)):
+			self.global_matrix(local, glob, ji)
+		return glob
+
+	def global_matrix(self, local, glob, ji):
+		if glob[ji] == None:
+			parent = self.parents[ji]
+			if parent < 0 or parent == ji:
+				glob[ji] = local[ji]
+			else:
+				glob[ji] = IDENTITY  ## guards against cycles
+				glob[ji] = mat_mul(self.global_matrix(local, glob, parent), local[ji])
+		return glob[ji]
+
+	def joint_matrices(self, pose):
+		## Matrices taking rest pose positions to the posed positions
+		local = []
+		for ji in range(0, len(pose)):
+			(rot, pos) = pose[ji]
+			local.append(mat_mul(self.local_rest[ji], quat_pos_matrix(rot, pos)))
+		glob = self.global_matrices(local)
+		return [mat_mul(glob[ji], self.inverse_rest[ji]) for ji in range(0, len(glob))]
+
+	def skin(self, pose):
+		## Returns a (N,3) numpy array when numpy is present and a list of
+		## (x, y, z) tuples otherwise.
+		mats = self.joint_matrices(pose)
+		if numpy != None:
+			return self.skin_numpy(mats)
+		return self.skin_python(mats)
+
+	def skin_frame(self, frame):
+		return self.skin(self.sampler.sample_frame(frame))
+
+	def bake(self, num_frames=None):
+		return [self.skin(pose) for pose in self.sampler.bake(num_frames)]
+
+	def skin_numpy(self, mats):
+		mm = numpy.array(mats + [IDENTITY], dtype=numpy.float64).reshape(len(mats) + 1, 3, 4)
+		pos = self.np_positions
+		out = numpy.zeros(pos.shape, dtype=numpy.float64)
+		for k in range(0, MAX_INFLUENCES):
+			w = self.np_weights[:, k]
+			if not w.any():
+				continue
+			m = mm[self.np_bone_ids[:, k]]
+			out += w[:, None] * (numpy.einsum('nij,nj->ni', m[:, :, 0:3], pos) + m[:, :, 3])
+		return out
+
+	def skin_python(self, mats):
+		out = []
+		bone_ids = self.bone_ids
+		weights = self.weights
+		it = iter(self.positions)
+		i = 0
+		for (x, y, z) in zip(it, it, it):
+			o_x = 0.0
+			o_y = 0.0
+			o_z = 0.0
+			for k in range(i, i + MAX_INFLUENCES):
+				w = weights[k]
+				if w == 0.0:
+					continue
+				b = bone_ids[k]
+				if b < 0 or b >= len(mats):
+					m = IDENTITY
+				else:
+					m = mats[b]
+				o_x = o_x + w * (m[0]*x + m[1]*y + m[2]*z + m[3])
+				o_y = o_y + w * (m[4]*x + m[5]*y + m[6]*z + m[7])
+				o_z = o_z + w * (m[8]*x + m[9]*y + m[10]*z + m[11])
+			out.append((o_x, o_y, o_z))
+			i = i + MAX_INFLUENCES
+		return out
+
+
+def quat_pos_matrix(q, pos):
+	(x, y, z, w) = q
+	(p_x, p_y, p_z) = pos
+	return (1.0 - 2.0*(y*y + z*z), 2.0*(x*y - w*z), 2.0*(x*z + w*y), p_x,
+		2.0*(x*y + w*z), 1.0 - 2.0*(x*x + z*z), 2.0*(y*z - w*x), p_y,
+		2.0*(x*z - w*y), 2.0*(y*z + w*x), 1.0 - 2.0*(x*x + y*y), p_z)
+
+
+def mat_mul(a, b):
+	return (a[0]*b[0] + a[1]*b[4] + a[2]*b[8],
+		a[0]*b[1] + a[1]*b[5] + a[2]*b[9],
+		a[0]*b[2] + a[1]*b[6] + a[2]*b[10],
+		a[0]*b[3] + a[1]*b[7] + a[2]*b[11] + a[3],
+		a[4]*b[0] + a[5]*b[4] + a[6]*b[8],
+		a[4]*b[1] + a[5]*b[5] + a[6]*b[9],
+		a[4]*b[2] + a[5]*b[6] + a[6]*b[10],
+		a[4]*b[3] + a[5]*b[7] + a[6]*b[11] + a[7],
+		a[8]*b[0] + a[9]*b[4] + a[10]*b[8],
+		a[8]*b[1] + a[9]*b[5] + a[10]*b[9],
+		a[8]*b[2] + a[9]*b[6] + a[10]*b[10],
+		a[8]*b[3] + a[9]*b[7] + a[10]*b[11] + a[11])
+
+
+## Inverse of a rotation and translation
+def mat_inverse(m):
+	t_x = -(m[0]*m[3] + m[4]*m[7] + m[8]*m[11])
+	t_y = -(m[1]*m[3] + m[5]*m[7] + m[9]*m[11])
+	t_z = -(m[2]*m[3] + m[6]*m[7] + m[10]*m[11])
+	return (m[0], m[4], m[8], t_x,
+		m[1], m[5], m[9], t_y,
+		m[2], m[6], m[10], t_z)
@@ -0,0 +1,163 @@
+##
+##  Convert between Milkshape 3D Text and MS3D files
+##
+##  Copyright 2023 Edward Blake
+##
+##  See the file "LICENSE" for information on usage and redistribution
+##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
+##
+
+import struct
+from ms3d import ms3d_import
+from ms3d import ms3d_export
+from ms3d.ms3d_cls import weld_group
+from ms3d.ms3d_import import VERTEX_STRUCT, TRIANGLE_STRUCT, GROUP_STRUCT, file_read_u16, file_read_block
+
+##
+## The rows of each mesh are packed straight into the vertex, triangle
+## and group sections of the binary file (and back), without making
+## MS3DVertex and MS3DTriangle objects or going through MeshHelper. The
+## result is the same as reading the file and writing it out again.
+##
+
+def transcode_ms3d_file(src_flname, dst_flname):
+	if ms3d_import.is_txt_file(src_flname):
+		transcode_txt_to_bin(src_flname, dst_flname)
+	else:
+		transcode_bin_to_txt(src_flname, dst_flname)
+
+
+##
+## Milkshape 3D Text (.txt) to MS3D (.ms3d)
+##
+
+def transcode_txt_to_bin(src_flname, dst_flname):
+	vertex_data = bytearray()
+	triangle_data = bytearray()
+	group_data = bytearray()
+	num_vertices = 0
+	num_triangles = 0
+	num_groups = 0
+	for m in ms3d_import.iter_ms3d_txt_meshes(src_flname):
+		if num_vertices + len(m.vertices) > ms3d_export.WRITER_MAX_VERTICES:
+			raise Exception("Too many vertices")
+		if num_triangles + len(m.trianglefaces) > ms3d_export.WRITER_MAX_TRIANGLES:
+			raise Exception("Too many triangles")
+		ref_counts = [0] * len(m.vertices)
+		group_data += GROUP_STRUCT.pack(m.meshflags, m.meshname.encode('ascii'), len(m.trianglefaces))
+		for tri in m.trianglefaces:
+			(flags, idx1, idx2, idx3, nidx1, nidx2, nidx3, smoothinggroup) = tri
+			(n_x1, n_y1, n_z1) = m.normals[nidx1]
+			(n_x2, n_y2, n_z2) = m.normals[nidx2]
+			(n_x3, n_y3, n_z3) = m.normals[nidx3]
+			v_u1 = m.vertices[idx1][4]
+			v_v1 = m.vertices[idx1][5]
+			v_u2 = m.vertices[idx2][4]
+			v_v2 = m.vertices[idx2][5]
+			v_u3 = m.vertices[idx3][4]
+			v_v3 = m.vertices[idx3][5]
+			triangle_data += TRIANGLE_STRUCT.pack(flags,
+				num_vertices + idx1, num_vertices + idx2, num_vertices + idx3,
+				n_x1, n_y1, n_z1, n_x2, n_y2, n_z2, n_x3, n_y3, n_z3,
+				v_u1, v_u2, v_u3, v_v1, v_v2, v_v3,
+				smoothinggroup, num_groups)
+			ref_counts[idx1] = ref_counts[idx1] + 1
+			ref_counts[idx2] = ref_counts[idx2] + 1
+			ref_counts[idx3] = ref_counts[idx3] + 1
+		group_data += struct.pack("<%dHb" % len(m.trianglefaces),
+			*(list(range(num_triangles, num_triangles + len(m.trianglefaces))) + [m.materialindex]))
+		for (v, ref_count) in zip(m.vertices, ref_counts):
+			(flags, v_x, v_y, v_z, v_u, v_v, boneindex) = v
+			vertex_data += VERTEX_STRUCT.pack(flags, v_x, v_y, v_z, boneindex, min(ref_count, 255))
+		num_vertices = num_vertices + len(m.vertices)
+		num_triangles = num_triangles + len(m.trianglefaces)
+		num_groups = num_groups + 1
+
+	materials = ms3d_import.read_ms3d_txt_materials(src_flname)
+
+	fp = ms3d_import.open_ms3d_file(dst_flname, "wb")
+	try:
+		ms3d_export.ms3d_header_t(fp)
+		ms3d_export.file_write_u16(fp, num_vertices)
+		fp.write(vertex_data)
+		ms3d_export.file_write_u16(fp, num_triangles)
+		fp.write(triangle_data)
+		ms3d_export.file_write_u16(fp, num_groups)
+		fp.write(group_data)
+		ms3d_export.file_write_u16(fp, len(materials))
+		for mat in materials:
+			ms3d_export.ms3d_material_t(fp, mat)
+
+		## keyframer data, the text reader does not keep it
+		ms3d_export.file_write_float(fp, 0.0)
+		ms3d_export.file_write_float(fp, 0.0)
+		ms3d_export.file_write_u32(fp, 0)
+		ms3d_export.file_write_u16(fp, 0) ## number of joints
+
+		## subVersion 1 and four empty comment lists
+		ms3d_export.file_write_u32(fp, 1)
+		for i in range(0, 4):
+			ms3d_export.file_write_u32(fp, 0)
+	finally:
+		fp.close()
+
+
+##
+## MS3D (.ms3d) to Milkshape 3D Text (.txt)
+##
+
+def transcode_bin_to_txt(src_flname, dst_flname):
+	fp = ms3d_import.open_ms3d_file(src_flname, "rb")
+	try:
+		if not ms3d_import.ms3d_header_t(fp):
+			raise Exception("Not a ms3d file")
+		num_vertices = file_read_u16(fp)
+		## flags, x, y, z, bone id
+		vertex_rows = [v[0:5] for v in VERTEX_STRUCT.iter_unpack(file_read_block(fp, num_vertices * VERTEX_STRUCT.size))]
+		num_triangles = file_read_u16(fp)
+		triangles = list(TRIANGLE_STRUCT.iter_unpack(file_read_block(fp, num_triangles * TRIANGLE_STRUCT.size)))
+		groups = ms3d_import.ms3d_groups_t(fp, file_read_u16(fp))
+		materials = ms3d_import.ms3d_materials_t(fp, file_read_u16(fp))
+	finally:
+		fp.close()
+
+	fp = ms3d_import.open_ms3d_file(dst_flname, "w")
+	try:
+		ms3d_export.write_txt_header(fp)
+		ms3d_export.write_txt_newline(fp)
+		ms3d_export.write_txt_section(fp, "Frames", 30)  ## total frames
+		ms3d_export.write_txt_section(fp, "Frame", 1)    ## current frame
+		ms3d_export.write_txt_newline(fp)
+
+		ms3d_export.write_txt_section(fp, "Meshes", len(groups))
+		for g in groups:
+			transcode_group_txt(fp, g, vertex_rows, triangles)
+		ms3d_export.write_txt_newline(fp)
+
+		ms3d_export.write_txt_section(fp, "Materials", len(materials))
+		for mat in materials:
+			ms3d_export.write_txt_material(fp, mat)
+		ms3d_export.write_txt_newline(fp)
+
+		ms3d_export.write_txt_section(fp, "Bones", 0)
+		ms3d_export.write_txt_section(fp, "GroupComments", 0)
+		ms3d_export.write_txt_section(fp, "MaterialComments", 0)
+		ms3d_export.write_txt_section(fp, "BoneComments", 0)
+		ms3d_export.write_txt_section(fp, "ModelComment", 0)
+	finally:
+		fp.close()
+
+## Same vertex and normal numbering as MeshHelper.get
+def transcode_group_txt(fp, g, vertex_rows, triangles):
+	tris = [triangles[tri_idx] for tri_idx in g.triangles]
+	corner_vs = []
+	corner_uvs = []
+	corner_vns = []
+	for tri in tris:
+		corner_vs.extend(tri[1:4])
+		## u1, u2, u3 then v1, v2, v3
+		corner_uvs.extend(((tri[13], tri[16]), (tri[14], tri[17]), (tri[15], tri[18])))
+		corner_vns.extend((tri[4:7], tri[7:10], tri[10:13]))
+	m = weld_group(g, [tri[0] for tri in tris], [tri[19] for tri in tris],
+		corner_vs, corner_uvs, corner_vns, vertex_rows)
+	ms3d_export.write_txt_mesh(fp, m)
@@ -104,8 +104,8 @@ def export_fun(attr, filename, content):
 				nmat.alphamap = path.relpath(texfilename, filename_dirname)
 		ms3df.materials.append(nmat)
 	
+	## set() also updates the ref counts
 	msh.set(ms3df)
-	ms3df.update_ref_counts()
 	
 	ms3d_export.write_ms3d_file(filename, ms3df)
 	
@@ -14,7 +14,12 @@ from os import path
 
 from ms3d import ms3d_import
 from ms3d.ms3d_cls import MS3DFile, MS3DMaterial, Mesh, MeshHelper
-from ms3d.ms3d_edges import first_common, alledges
+from ms3d.ms3d_edges import first_commons, hard_edges
+
+## Normals the same to this many bits per component are merged, normals
+## of a smooth mesh that only differ by float rounding then share one
+## entry
+IMPORT_NORMAL_BITS = 16
 
 
 ###
@@ -24,21 +29,32 @@ from ms3d.ms3d_edges import first_common, alledges
 def import_fun(attr, filename):
 	filename_dirname = path.dirname(filename)
 	
-	ms3df = ms3d_import.read_ms3d_file(filename)
-	msh = MeshHelper()
-	msh.get(ms3df)
+	if ms3d_import.is_txt_file(filename):
+		## Text files already have the data per mesh
+		(meshes, materials) = ms3d_import.read_ms3d_txt_meshes(filename)
+		for m in meshes:
+			m.drop_unused_vertices()
+	else:
+		## Joints, comments and the extra information are not used here
+		ms3df = ms3d_import.read_ms3d_file(filename, sections=ms3d_import.READ_GEOMETRY | ms3d_import.READ_MATERIALS)
+		msh = MeshHelper(normal_bits=IMPORT_NORMAL_BITS)
+		msh.get(ms3df)
+		meshes = msh.meshes
+		materials = ms3df.materials
 	
 	objdict = {}
-	for m in msh.meshes:
+	meshidxs = first_commons(meshes)
+	for mi in range(0, len(meshes)):
+		m = meshes[mi]
 		meshname = m.meshname
 		if (meshname == None) or (meshname == ''):
 			meshname = 'None'
 		
 		matname = 'default'
-		if len(ms3df.materials) > m.materialindex:
-			matname = ms3df.materials[m.materialindex].name
+		if len(materials) > m.materialindex:
+			matname = materials[m.materialindex].name
 		
-		meshidx = first_common(m, msh.meshes)
+		meshidx = meshidxs[mi]
 		
 		if not meshidx in objdict:
 			mesh = w3d_e3d.E3DMesh()
@@ -47,7 +63,7 @@ def import_fun(attr, filename):
 			mesh.ns = []
 			mesh.vs = []
 			mesh.tx = []
-			objdict[meshidx] = [mesh, meshname]
+			objdict[meshidx] = [mesh, meshname, []]
 		
 		vsoffset = len(objdict[meshidx][0].vs)
 		nsoffset = len(objdict[meshidx][0].ns)
@@ -69,12 +85,13 @@ def import_fun(attr, filename):
 			face.ns = [n1+nsoffset,n2+nsoffset,n3+nsoffset]
 			face.mat = [matname]
 			objdict[meshidx][0].fs.append(face)
+			objdict[meshidx][2].append(sg)
 	
 	objs = []
 	for _,name_and_mesh in objdict.items():
 		mesh = name_and_mesh[0]
 		mesh.vc = []
-		mesh.he = alledges(mesh.fs)
+		mesh.he = hard_edges(mesh.fs, mesh.vs, mesh.ns, name_and_mesh[2])
 		meshname = name_and_mesh[1]
 		obj = w3d_e3d.E3DObject()
 		obj.name = meshname
@@ -82,7 +99,7 @@ def import_fun(attr, filename):
 		objs.append(obj)
 		
 	mats = []
-	for mat in ms3df.materials:
+	for mat in materials:
 		nmat = w3d_e3d.Material()
 		nmat.name = mat.name
 		nmatogl = w3d_e3d.MaterialOpenGLAttributes()
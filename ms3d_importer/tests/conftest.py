@@ -0,0 +1,5 @@
+import sys
+from os import path
+
+## The plugins import the ms3d package from their own directory
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
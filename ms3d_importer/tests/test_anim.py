@@ -0,0 +1,43 @@
+##
+##  Joint animation sampling
+##
+##  Copyright 2023 Edward Blake
+##
+##  See the file "LICENSE" for information on usage and redistribution
+##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
+##
+
+import math
+from ms3d.ms3d_anim import MS3DAnimSampler
+from ms3d.ms3d_cls import MS3DFile, MS3DJoint
+
+
+def moving_joint_file(num_frames):
+	msf = MS3DFile()
+	msf.anim = (10.0, 0.0, num_frames)
+	j = MS3DJoint()
+	j.jointname = "root"
+	j.key_frames_rot = [(0.0, 0.0, 0.0, 0.0), (1.0, 0.0, 0.0, math.pi / 2)]
+	j.key_frames_pos = [(0.0, 0.0, 0.0, 0.0), (1.0, 2.0, 0.0, 0.0)]
+	msf.joints.append(j)
+	return msf
+
+
+def test_bake_keeps_only_the_last_pose():
+	sampler = MS3DAnimSampler(moving_joint_file(100))
+	poses = sampler.bake()
+	assert len(poses) == 100
+	## frame 5 at 10 fps is half way between the keys
+	((rot, pos),) = poses[4]
+	assert pos == (1.0, 0.0, 0.0)
+	assert abs(rot[2] - math.sin(math.pi / 8)) < 1e-12
+	## the cache holds one pose, not one per frame
+	assert sampler.cache == (10.0, poses[-1])
+	assert sampler.sample_frame(100) is poses[-1]
+
+def test_poses_cannot_be_changed_by_callers():
+	sampler = MS3DAnimSampler(moving_joint_file(10))
+	pose = sampler.sample(0.5)
+	assert isinstance(pose, tuple)
+	assert all(isinstance(rot, tuple) and isinstance(pos, tuple) for (rot, pos) in pose)
+	assert sampler.sample(0.5) == pose
@@ -0,0 +1,108 @@
+##
+##  Parse cache
+##
+##  Copyright 2023 Edward Blake
+##
+##  See the file "LICENSE" for information on usage and redistribution
+##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
+##
+
+import os
+import pytest
+from ms3d import ms3d_cache
+from ms3d.ms3d_cache import MS3DCache, CACHE_SUFFIX
+from ms3d.ms3d_cls import MS3DFile, MS3DVertex, MS3DTriangle, MS3DGroup
+from ms3d.ms3d_export import write_ms3d_bin_file
+
+
+## A triangle per file, made different by offset
+def write_files(tmp_path, num):
+	flnames = []
+	for i in range(0, num):
+		msf = MS3DFile()
+		for (x, y) in ((0, 0), (1, 0), (0, 1)):
+			v = MS3DVertex()
+			v.v_x = float(x + i)
+			v.v_y = float(y)
+			msf.vertices.append(v)
+		g = MS3DGroup()
+		g.name = "g"
+		g.triangles = [0]
+		msf.groups.append(g)
+		t = MS3DTriangle()
+		(t.v_1, t.v_2, t.v_3) = (0, 1, 2)
+		msf.triangles.append(t)
+		msf.update_ref_counts()
+		flname = str(tmp_path / ("m%d.ms3d" % i))
+		write_ms3d_bin_file(flname, msf)
+		flnames.append(flname)
+	return flnames
+
+def cache_files(cache_dir):
+	return sorted(nm for nm in os.listdir(cache_dir) if nm.endswith(CACHE_SUFFIX))
+
+
+def test_store_and_evict_without_scanning(tmp_path, monkeypatch):
+	flnames = write_files(tmp_path, 6)
+	cache_dir = str(tmp_path / "cache")
+	cache = MS3DCache(cache_dir)
+	cache.read_ms3d_file(flnames[0])
+	entry_bytes = cache.stats()["bytes"]
+	## room for three entries
+	cache = MS3DCache(cache_dir, max_bytes=entry_bytes * 3)
+	assert cache.stats()["entries"] == 1
+
+	scans = []
+	listdir = os.listdir
+	def counted_listdir(d):
+		scans.append(d)
+		return listdir(d)
+	monkeypatch.setattr(ms3d_cache.os, "listdir", counted_listdir)
+	for flname in flnames[1:3]:
+		cache.read_ms3d_file(flname)
+	## flnames[0] becomes the most recently used, flnames[1] the least
+	assert cache.read_ms3d_file(flnames[0]).vertices[0].v_x == 0.0
+	for flname in flnames[3:]:
+		cache.read_ms3d_file(flname)
+	assert scans == []
+	monkeypatch.undo()
+
+	stats = cache.stats()
+	assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 5, 3)
+	assert (stats["entries"], stats["bytes"]) == (3, entry_bytes * 3)
+	assert cache_files(cache_dir) == sorted(cache.key(flname, ms3d_cache.ms3d_import.READ_ALL) + CACHE_SUFFIX
+		for flname in flnames[3:])
+	## a new cache finds the same entries
+	assert MS3DCache(cache_dir).stats()["bytes"] == entry_bytes * 3
+
+
+def test_corrupt_entry_is_removed(tmp_path):
+	(flname,) = write_files(tmp_path, 1)
+	cache_dir = str(tmp_path / "cache")
+	cache = MS3DCache(cache_dir)
+	cache.read_ms3d_file(flname)
+	(nm,) = cache_files(cache_dir)
+	cache_flname = os.path.join(cache_dir, nm)
+	with open(cache_flname, "r+b") as fp:
+		fp.truncate(os.path.getsize(cache_flname) // 2)
+
+	cache = MS3DCache(cache_dir)
+	assert cache.load(cache_flname) == None
+	assert cache_files(cache_dir) == []
+	assert cache.stats()["bytes"] == 0
+	## read again and stored again
+	assert len(cache.read_ms3d_file(flname).triangles) == 1
+	assert cache.stats()["misses"] == 1
+	assert cache_files(cache_dir) == [nm]
+
+
+def test_other_errors_are_not_hidden(tmp_path, monkeypatch):
+	(flname,) = write_files(tmp_path, 1)
+	cache = MS3DCache(str(tmp_path / "cache"))
+	cache.read_ms3d_file(flname)
+	def broken_unpack(data):
+		raise AttributeError("bug in the unpack code")
+	monkeypatch.setattr(ms3d_cache, "unpack_ms3d_file", broken_unpack)
+	with pytest.raises(AttributeError):
+		cache.read_ms3d_file(flname)
+	assert cache.stats()["entries"] == 1
@@ -0,0 +1,162 @@
+##
+##  Edge functions
+##
+##  Copyright 2023 Edward Blake
+##
+##  See the file "LICENSE" for information on usage and redistribution
+##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
+##
+
+import random
+from ms3d.ms3d_cls import Mesh
+from ms3d.ms3d_edges import hard_edges, first_common, first_commons, rev_edgecoords
+
+
+class Face:
+	def __init__(self, vs, ns):
+		self.vs = vs
+		self.ns = ns
+
+## 8 corners, 6 sides of 2 triangles
+CUBE_VS = [(x, y, z) for x in (0.0, 1.0) for y in (0.0, 1.0) for z in (0.0, 1.0)]
+CUBE_QUADS = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+
+def cube_faces(normal_of):
+	fs = []
+	for qi in range(0, len(CUBE_QUADS)):
+		q = CUBE_QUADS[qi]
+		for tri in ((q[0], q[1], q[2]), (q[0], q[2], q[3])):
+			fs.append(Face(list(tri), [normal_of(qi, v_i) for v_i in tri]))
+	return fs
+
+def edge_set(he):
+	return set(frozenset(e) for e in he)
+
+## Every pair of face sides on an edge compared with each other
+def brute_hard_edges(fs, vs, ns, sgs):
+	sides = []
+	for fi in range(0, len(fs)):
+		f = fs[fi]
+		for i in range(0, len(f.vs)):
+			j = (i + 1) % len(f.vs)
+			sides.append((fi, f.vs[i], f.vs[j], f.ns[i], f.ns[j]))
+	hard = set()
+	for x in sides:
+		for y in sides:
+			if x[0] == y[0]:
+				continue
+			if (vs[x[1]], vs[x[2]]) == (vs[y[1]], vs[y[2]]):
+				same = ns[x[3]] == ns[y[3]] and ns[x[4]] == ns[y[4]]
+			elif (vs[x[1]], vs[x[2]]) == (vs[y[2]], vs[y[1]]):
+				same = ns[x[3]] == ns[y[4]] and ns[x[4]] == ns[y[3]]
+			else:
+				continue
+			if not same or sgs[x[0]] != sgs[y[0]]:
+				hard.add(frozenset((x[1], x[2])))
+				hard.add(frozenset((y[1], y[2])))
+	return hard
+
+
+def test_flat_cube_has_all_12_edges():
+	ns = [(0.0, 0.0, float(qi)) for qi in range(0, 6)]
+	fs = cube_faces(lambda qi, v_i: qi)
+	he = hard_edges(fs, CUBE_VS, ns, [1] * len(fs))
+	assert len(he) == 12
+	assert edge_set(he) == set(frozenset((q[i], q[(i + 1) % 4])) for q in CUBE_QUADS for i in range(0, 4))
+
+def test_smooth_cube_has_none():
+	ns = [(x - 0.5, y - 0.5, z - 0.5) for (x, y, z) in CUBE_VS]
+	fs = cube_faces(lambda qi, v_i: v_i)
+	assert hard_edges(fs, CUBE_VS, ns, [1] * len(fs)) == []
+
+def test_smoothing_groups_give_hard_edges():
+	vs = [(0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (1.0, 1.0, 0.0), (0.0, 1.0, 0.0)]
+	ns = [(0.0, 0.0, 1.0)]
+	fs = [Face([0, 1, 2], [0, 0, 0]), Face([0, 2, 3], [0, 0, 0])]
+	assert hard_edges(fs, vs, ns, [1, 1]) == []
+	assert edge_set(hard_edges(fs, vs, ns, [1, 2])) == {frozenset((0, 2))}
+
+def test_edge_of_three_faces():
+	## Three faces on the edge 0-1, the third with split vertices at the
+	## same places (a uv seam). Each face is compared with the first.
+	vs = [(0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.5, 1.0, 0.0), (0.5, -1.0, 0.0),
+		(0.5, 0.0, 1.0), (0.0, 0.0, 0.0), (1.0, 0.0, 0.0)]
+	ns = [(0.0, 0.0, 1.0)]
+	fs = [Face([0, 1, 2], [0, 0, 0]), Face([1, 0, 3], [0, 0, 0]), Face([5, 6, 4], [0, 0, 0])]
+	assert hard_edges(fs, vs, ns, [1, 1, 1]) == []
+	for sgs in ([1, 1, 2], [1, 2, 1], [2, 1, 1]):
+		he = hard_edges(fs, vs, ns, sgs)
+		## one pair per side, the first two faces share their vertices
+		assert edge_set(he) == {frozenset((0, 1)), frozenset((5, 6))}
+		assert len(he) == 2
+		assert edge_set(he) == brute_hard_edges(fs, vs, ns, sgs)
+
+def test_matches_brute_force_on_random_meshes():
+	for seed in range(0, 200):
+		r = random.Random(seed)
+		pos = [(float(r.randint(0, 3)), float(r.randint(0, 2)), 0.0) for i in range(0, 8)]
+		## and split vertices at the same places
+		vs = pos + [pos[r.randrange(8)] for i in range(0, 4)]
+		ns = [(0.0, 0.0, 1.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)]
+		fs = []
+		sgs = []
+		for k in range(0, r.randint(1, 12)):
+			idx = r.sample(range(0, len(vs)), 3)
+			if len(set(vs[i] for i in idx)) < 3:
+				continue
+			fs.append(Face(idx, [r.randrange(3) for i in range(0, 3)]))
+			sgs.append(r.randint(0, 2))
+		he = hard_edges(fs, vs, ns, sgs)
+		assert edge_set(he) == brute_hard_edges(fs, vs, ns, sgs)
+		assert len(he) == len(edge_set(he))
+
+
+## first_common() as it was, searching the meshes one by one
+def pairwise_first_common(m, meshes):
+	el = [(b, a) for (a, b) in rev_edgecoords(m)]
+	for i in range(0, len(meshes)):
+		elcomp = rev_edgecoords(meshes[i])
+		for e in el:
+			if e in elcomp:
+				return i
+	return None
+
+def triangle_mesh(tris):
+	m = Mesh()
+	for tri in tris:
+		base = len(m.vertices)
+		for (v_x, v_y, v_z) in tri:
+			m.vertices.append((0, v_x, v_y, v_z, 0.0, 0.0, -1))
+		m.trianglefaces.append((0, base, base + 1, base + 2, 0, 0, 0, 1))
+	return m
+
+def test_first_commons_matches_pairwise_first_common():
+	for seed in range(0, 40):
+		r = random.Random(seed)
+		pts = [(float(r.randint(0, 5)), float(r.randint(0, 5)), 0.0) for i in range(0, 30)]
+		meshes = []
+		for k in range(0, 40):
+			tris = []
+			for t in range(0, r.randint(0, 4)):
+				tri = r.sample(pts, 3)
+				## the same edges the other way around, or the same way
+				if r.random() < 0.3:
+					tri.reverse()
+				tris.append(tri)
+			meshes.append(triangle_mesh(tris))
+		ref = [pairwise_first_common(m, meshes) for m in meshes]
+		assert first_commons(meshes) == ref
+		assert [first_common(m, meshes) for m in meshes] == ref
+
+def test_first_commons_without_common_edges():
+	a = triangle_mesh([((0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0))])
+	## the same edges the same way round are not common
+	b = triangle_mesh([((0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0))])
+	c = triangle_mesh([((5.0, 0.0, 0.0), (6.0, 0.0, 0.0), (5.0, 1.0, 0.0))])
+	empty = triangle_mesh([])
+	## d shares an edge with c the other way round, and with nothing else
+	d = triangle_mesh([((6.0, 0.0, 0.0), (5.0, 0.0, 0.0), (5.0, -1.0, 0.0))])
+	meshes = [a, b, empty, c, d]
+	assert first_commons(meshes) == [None, None, None, 4, 3]
+	assert first_commons(meshes) == [pairwise_first_common(m, meshes) for m in meshes]
+	assert first_commons([]) == []
@@ -0,0 +1,140 @@
+##
+##  Memory use of a read MS3DFile
+##
+##  Copyright 2023 Edward Blake
+##
+##  See the file "LICENSE" for information on usage and redistribution
+##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
+##
+
+import math
+import struct
+import tracemalloc
+from ms3d import ms3d_import
+from ms3d.ms3d_cls import MS3DFile, MS3DVertex, MS3DTriangle, MS3DGroup, MS3DVertex_ex, MS3DModel_ex
+from ms3d.ms3d_export import write_ms3d_bin_file
+from ms3d.ms3d_import import VERTEX_STRUCT, TRIANGLE_STRUCT, GROUP_STRUCT
+
+## A smooth 151 x 217 quad grid, 65534 triangles (the most a .ms3d
+## file can have)
+GRID_W = 151
+GRID_H = 217
+
+## With __slots__ and the tuple sharing in ms3d_triangles_t it comes to
+## about 160 bytes per vertex and 390 per triangle. Without __slots__ a
+## vertex takes 210, without the sharing a triangle takes 990.
+MAX_BYTES_PER_VERTEX = 180
+MAX_BYTES_PER_TRIANGLE = 450
+
+
+def grid_ms3d(flname, with_triangles):
+	def vertex_index(x, y):
+		return y * (GRID_W + 1) + x
+	def normal(x, y):
+		## a gentle bump, so corners at one vertex share their normal
+		n_x = math.sin(x * 0.1) * 0.3
+		n_y = math.cos(y * 0.1) * 0.3
+		n_len = math.sqrt(n_x * n_x + n_y * n_y + 1.0)
+		return (n_x / n_len, n_y / n_len, 1.0 / n_len)
+	def uv(x, y):
+		return (x / GRID_W, y / GRID_H)
+
+	data = bytearray(b"MS3D000000" + struct.pack("<i", 4))
+	data += struct.pack("<H", (GRID_W + 1) * (GRID_H + 1))
+	for y in range(0, GRID_H + 1):
+		for x in range(0, GRID_W + 1):
+			data += VERTEX_STRUCT.pack(0, float(x), float(y), 0.0, -1, 6)
+
+	triangles = []
+	if with_triangles:
+		for y in range(0, GRID_H):
+			for x in range(0, GRID_W):
+				triangles.append(((x, y), (x + 1, y), (x + 1, y + 1)))
+				triangles.append(((x, y), (x + 1, y + 1), (x, y + 1)))
+	data += struct.pack("<H", len(triangles))
+	for corners in triangles:
+		vs = [vertex_index(x, y) for (x, y) in corners]
+		ns = [c for (x, y) in corners for c in normal(x, y)]
+		uvs = [uv(x, y) for (x, y) in corners]
+		data += TRIANGLE_STRUCT.pack(0, vs[0], vs[1], vs[2], *ns,
+			uvs[0][0], uvs[1][0], uvs[2][0], uvs[0][1], uvs[1][1], uvs[2][1], 1, 0)
+
+	data += struct.pack("<H", 1)
+	data += GROUP_STRUCT.pack(0, b"grid", len(triangles))
+	data += struct.pack("<%dHb" % len(triangles), *(list(range(0, len(triangles))) + [-1]))
+	data += struct.pack("<H", 0)          ## materials
+	data += struct.pack("<ffi", 30.0, 1.0, 30)
+	data += struct.pack("<H", 0)          ## joints
+	with open(flname, "wb") as fp:
+		fp.write(data)
+	return len(triangles)
+
+
+def traced_read(flname):
+	tracemalloc.start()
+	try:
+		ms3df = ms3d_import.read_ms3d_file(flname, sections=ms3d_import.READ_GEOMETRY)
+		used = tracemalloc.get_traced_memory()[0]
+	finally:
+		tracemalloc.stop()
+	return (ms3df, used)
+
+
+def test_bytes_per_vertex_and_triangle(tmp_path):
+	vertices_only = str(tmp_path / "vertices.ms3d")
+	whole = str(tmp_path / "grid.ms3d")
+	grid_ms3d(vertices_only, False)
+	num_triangles = grid_ms3d(whole, True)
+	assert num_triangles == 65534
+
+	(ms3df, used) = traced_read(vertices_only)
+	num_vertices = len(ms3df.vertices)
+	bytes_per_vertex = used / num_vertices
+	del ms3df
+
+	(ms3df, used) = traced_read(whole)
+	assert len(ms3df.triangles) == num_triangles
+	bytes_per_triangle = (used - bytes_per_vertex * num_vertices) / num_triangles
+
+	assert bytes_per_vertex <= MAX_BYTES_PER_VERTEX
+	assert bytes_per_triangle <= MAX_BYTES_PER_TRIANGLE
+
+
+def test_shared_tuples_keep_signed_zeros(tmp_path):
+	## The same normals and uvs but for the sign of a zero, first with
+	## +0.0 so a -0.0 tuple could be swapped for it
+	msf = MS3DFile()
+	for (x, y) in ((0, 0), (1, 0), (1, 1)):
+		v = MS3DVertex()
+		v.v_x = float(x)
+		v.v_y = float(y)
+		msf.vertices.append(v)
+	g = MS3DGroup()
+	g.name = "zeros"
+	msf.groups.append(g)
+	for zero in (0.0, -0.0, 0.0, -0.0):
+		t = MS3DTriangle()
+		(t.v_1, t.v_2, t.v_3) = (0, 1, 2)
+		t.vn1 = (zero, 0.0, 1.0)
+		t.vn2 = (0.0, zero, 1.0)
+		t.vn3 = (zero, zero, -1.0)
+		t.uv1 = (zero, 0.5)
+		t.uv2 = (0.5, zero)
+		t.uv3 = (zero, zero)
+		g.triangles.append(len(msf.triangles))
+		msf.triangles.append(t)
+	msf.update_ref_counts()
+	msf.extra = ([MS3DVertex_ex() for v in msf.vertices], [], MS3DModel_ex())
+	flname = str(tmp_path / "zeros.ms3d")
+	write_ms3d_bin_file(flname, msf)
+
+	ms3df = ms3d_import.read_ms3d_file(flname)
+	for (t, t_0) in zip(ms3df.triangles, msf.triangles):
+		for nm in ("vn1", "vn2", "vn3", "uv1", "uv2", "uv3"):
+			assert [math.copysign(1.0, c) for c in getattr(t, nm)] == [math.copysign(1.0, c) for c in getattr(t_0, nm)]
+	again = str(tmp_path / "again.ms3d")
+	write_ms3d_bin_file(again, ms3df)
+	with open(flname, "rb") as fp:
+		data = fp.read()
+	with open(again, "rb") as fp:
+		assert fp.read() == data
@@ -0,0 +1,123 @@
+##
+##  MeshHelper conversions
+##
+##  Copyright 2023 Edward Blake
+##
+##  See the file "LICENSE" for information on usage and redistribution
+##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
+##
+
+import pytest
+from ms3d import ms3d_cls
+from ms3d.ms3d_cls import MS3DFile, MS3DVertex, MS3DTriangle, MS3DGroup, MS3DColumnFile, MeshHelper
+
+NAN = float("nan")
+INF = float("inf")
+
+
+## A strip of quads in num_groups groups, corner normals from normal()
+def strip_file(num_quads, num_groups, normal):
+	msf = MS3DFile()
+	for x in range(0, num_quads + 1):
+		for y in (0, 1):
+			v = MS3DVertex()
+			v.v_x = float(x)
+			v.v_y = float(y)
+			msf.vertices.append(v)
+	for gi in range(0, num_groups):
+		g = MS3DGroup()
+		g.name = "g%d" % gi
+		msf.groups.append(g)
+	for x in range(0, num_quads):
+		for corners in ((x*2, x*2 + 2, x*2 + 3), (x*2, x*2 + 3, x*2 + 1)):
+			t = MS3DTriangle()
+			(t.v_1, t.v_2, t.v_3) = corners
+			t.vn1 = normal(len(msf.triangles), 0)
+			t.vn2 = normal(len(msf.triangles), 1)
+			t.vn3 = normal(len(msf.triangles), 2)
+			t.uv1 = (0.0, 0.0)
+			t.uv2 = (0.5, 0.0)
+			t.uv3 = (0.5, 0.5)
+			t.sg = 1
+			t.g_idx = x % num_groups
+			msf.groups[t.g_idx].triangles.append(len(msf.triangles))
+			msf.triangles.append(t)
+	msf.update_ref_counts()
+	return msf
+
+## repr() so that NaN compares equal to NaN
+def mesh_rows(meshes):
+	return [repr((m.meshname, m.vertices, m.normals, m.trianglefaces)) for m in meshes]
+
+
+def odd_normal(tri_idx, corner):
+	## every third triangle is degenerate, the rest nearly up
+	if tri_idx % 3 == 0:
+		return ((NAN, 0.0, 0.0), (INF, 0.0, 0.0), (0.0, -INF, NAN))[corner]
+	return (0.0, 0.0, 1.0 - corner * 2.0**-30)
+
+
+def test_normal_bits_with_nan_and_inf_normals():
+	msf = strip_file(12, 2, odd_normal)
+	exact = MeshHelper()
+	exact.get(msf)
+	msh = MeshHelper(normal_bits=16)
+	msh.get(msf)
+	for (g, m_exact, m) in zip(msf.groups, exact.meshes, msh.meshes):
+		## the nearly equal normals are merged, NaN is never the same as
+		## another NaN so each corner with one keeps its own
+		assert len([n for n in m_exact.normals if n[2] > 0.5]) == 3
+		assert len([n for n in m.normals if n[2] > 0.5]) == 1
+		nan_corners = len([ti for ti in g.triangles if ti % 3 == 0]) * 2
+		assert len([n for n in m.normals if n[0] != n[0] or n[2] != n[2]]) == nan_corners
+		assert m.normals.count((INF, 0.0, 0.0)) == 1
+
+
+def test_normal_bits_get_column_and_numpy_paths_agree(monkeypatch):
+	## float32 representable normals, so the columns hold the same values
+	def normal(tri_idx, corner):
+		if tri_idx % 4 == 0:
+			return ((NAN, 0.0, 0.0), (INF, 0.0, 0.0), (0.0, -INF, 0.5))[corner]
+		return (0.0, 0.5 * corner, 1.0)
+	msf = strip_file(40, 3, normal)
+	msh = MeshHelper(normal_bits=16)
+	msh.get(msf)
+	cf = MS3DColumnFile()
+	cf.from_ms3d_file(msf)
+	thresholds = [10**9]
+	if ms3d_cls.numpy != None:
+		thresholds.append(0)
+	for threshold in thresholds:
+		monkeypatch.setattr(ms3d_cls, "WELD_NUMPY_MIN_CORNERS", threshold)
+		cols = MeshHelper(normal_bits=16)
+		cols.get_columns(cf)
+		assert mesh_rows(cols.meshes) == mesh_rows(msh.meshes)
+		rows = MeshHelper(normal_bits=16)
+		rows.get(msf)
+		assert mesh_rows(rows.meshes) == mesh_rows(msh.meshes)
+
+
+def test_incremental_get_replaces_meshes():
+	def normal(tri_idx, corner):
+		return (0.0, 0.0, 1.0)
+	msf = strip_file(10, 3, normal)
+	msh = MeshHelper(incremental=True)
+	msh.get(msf)
+	first = msh.meshes
+	msh.get(msf)
+	assert len(msh.meshes) == 3
+	## unchanged groups give the very same meshes
+	assert all(m is m_first for (m, m_first) in zip(msh.meshes, first))
+
+	## neighbouring quads share vertices, only the groups using the
+	## moved vertex are converted again
+	vi = msf.triangles[msf.groups[1].triangles[0]].v_1
+	msf.vertices[vi].v_z = 2.0
+	msh.get(msf)
+	fresh = MeshHelper()
+	fresh.get(msf)
+	assert mesh_rows(msh.meshes) == mesh_rows(fresh.meshes)
+	for gi in range(0, 3):
+		uses = [ti for ti in msf.groups[gi].triangles if vi in (msf.triangles[ti].v_1, msf.triangles[ti].v_2, msf.triangles[ti].v_3)]
+		assert (msh.meshes[gi] is first[gi]) == (len(uses) == 0)
+
@@ -0,0 +1,94 @@
+##
+##  Packed snapshots of MS3DFile
+##
+##  Copyright 2023 Edward Blake
+##
+##  See the file "LICENSE" for information on usage and redistribution
+##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
+##
+
+import os
+from ms3d import ms3d_import
+from ms3d.ms3d_cls import MS3DFile, MS3DVertex, MS3DTriangle, MS3DGroup, MS3DJoint, MS3DVertex_ex, MS3DJoint_ex, MS3DModel_ex
+from ms3d.ms3d_export import write_ms3d_bin_file
+from ms3d.ms3d_pack import pack_ms3d_file, unpack_ms3d_file
+
+## A packed binary file may be a little larger than the file itself,
+## it was about 2.4 times the size with every column as int or double
+MAX_PACK_RATIO = 1.2
+
+
+## A strip of quads with one joint, values as given by coord()
+def strip_file(num_quads, coord):
+	msf = MS3DFile()
+	ex_vs = []
+	for x in range(0, num_quads + 1):
+		for y in (0, 1):
+			v = MS3DVertex()
+			v.v_x = coord(x)
+			v.v_y = coord(y)
+			v.v_z = coord(x + y)
+			v.bone_id = 0
+			msf.vertices.append(v)
+			ex = MS3DVertex_ex()
+			ex.bone_id1 = 0
+			ex.weight1 = 0.35
+			ex.weight2 = 0.65
+			ex_vs.append(ex)
+	g = MS3DGroup()
+	g.name = "strip"
+	msf.groups.append(g)
+	for x in range(0, num_quads):
+		for corners in ((x*2, x*2 + 2, x*2 + 3), (x*2, x*2 + 3, x*2 + 1)):
+			t = MS3DTriangle()
+			(t.v_1, t.v_2, t.v_3) = corners
+			t.vn1 = (0.0, coord(x), 1.0)
+			t.vn2 = (0.0, coord(x + 1), 1.0)
+			t.vn3 = (0.0, coord(x + 2), 1.0)
+			t.uv1 = (coord(x), 0.0)
+			t.uv2 = (coord(x + 1), 0.0)
+			t.uv3 = (coord(x + 1), 1.0)
+			t.sg = 1
+			g.triangles.append(len(msf.triangles))
+			msf.triangles.append(t)
+	j = MS3DJoint()
+	j.jointname = "root"
+	j.key_frames_rot = [(coord(i), 0.0, coord(i + 1), 0.5) for i in range(0, 4)]
+	j.key_frames_pos = [(coord(i), 1.0, 2.0, 3.0) for i in range(0, 4)]
+	msf.joints.append(j)
+	msf.anim = (30.0, 0.0, 4)
+	msf.update_ref_counts()
+	msf.extra = (ex_vs, [MS3DJoint_ex()], MS3DModel_ex())
+	return msf
+
+def file_rows(ms3df):
+	def fields(o):
+		return repr([getattr(o, nm) for nm in type(o).__slots__])
+	(ex_vs, ex_jn, ex_md) = ms3df.extra
+	return ([fields(o) for o in ms3df.vertices + ms3df.triangles + ms3df.groups + ms3df.joints + ex_vs + ex_jn]
+		+ [fields(ex_md), repr(ms3df.anim)])
+
+
+def test_pack_binary_file_is_compact(tmp_path):
+	flname = str(tmp_path / "strip.ms3d")
+	ms3df = strip_file(200, lambda i: i * 0.25)
+	## Without the joint, which the binary writer cannot write yet
+	ms3df.joints = []
+	ms3df.extra = (ms3df.extra[0], [], ms3df.extra[2])
+	write_ms3d_bin_file(flname, ms3df)
+	ms3df = ms3d_import.read_ms3d_file(flname)
+	data = pack_ms3d_file(ms3df)
+	assert file_rows(unpack_ms3d_file(data)) == file_rows(ms3df)
+	assert len(data) <= os.path.getsize(flname) * MAX_PACK_RATIO
+
+
+def test_pack_keeps_text_file_values():
+	## Doubles that are not float32 and indices past the binary limits,
+	## as a text file can have
+	ms3df = strip_file(20, lambda i: i * 0.1 + 1e-12)
+	ms3df.triangles[0].v_1 = 70000
+	ms3df.triangles[0].g_idx = 300
+	ms3df.vertices[0].bone_id = 200
+	ms3df.vertices[1].v_x = 1e300
+	ms3df.extra[0][0].weight1 = 1.0 / 3.0
+	assert file_rows(unpack_ms3d_file(pack_ms3d_file(ms3df))) == file_rows(ms3df)
@@ -0,0 +1,79 @@
+##
+##  The workers argument
+##
+##  Copyright 2023 Edward Blake
+##
+##  See the file "LICENSE" for information on usage and redistribution
+##  of this file, and for a DISCLAIMER OF ALL WARRANTIES.
+##
+
+import multiprocessing
+import pytest
+from ms3d import ms3d_cls, ms3d_import
+from ms3d.ms3d_cls import MS3DFile, MS3DVertex, MS3DTriangle, MS3DGroup, MS3DColumnFile, MeshHelper
+from ms3d.ms3d_export import write_ms3d_bin_file, write_ms3d_txt_file
+
+
+def two_group_file():
+	msf = MS3DFile()
+	for (x, y) in ((0, 0), (1, 0), (1, 1), (0, 1)):
+		v = MS3DVertex()
+		v.v_x = float(x)
+		v.v_y = float(y)
+		msf.vertices.append(v)
+	for (gi, corners) in enumerate(((0, 1, 2), (0, 2, 3))):
+		g = MS3DGroup()
+		g.name = "g%d" % gi
+		g.triangles = [gi]
+		msf.groups.append(g)
+		t = MS3DTriangle()
+		(t.v_1, t.v_2, t.v_3) = corners
+		t.vn1 = t.vn2 = t.vn3 = (0.0, 0.0, 1.0)
+		t.g_idx = gi
+		msf.triangles.append(t)
+	msf.update_ref_counts()
+	return msf
+
+@pytest.fixture
+def no_pool(monkeypatch):
+	def no_executor(*args, **kwargs):
+		raise Exception("started a process pool")
+	monkeypatch.setattr(ms3d_cls, "ProcessPoolExecutor", no_executor)
+	monkeypatch.setattr(ms3d_import, "ProcessPoolExecutor", no_executor)
+
+
+@pytest.mark.parametrize("workers", [None, 1])
+def test_one_worker_starts_no_pool(tmp_path, no_pool, workers):
+	msf = two_group_file()
+	msh = MeshHelper()
+	msh.get(msf, workers=workers)
+	assert len(msh.meshes) == 2
+	cf = MS3DColumnFile()
+	msh.set_columns(cf, workers=workers)
+	assert len(cf.groups) == 2
+
+	bin_flname = str(tmp_path / "quad.ms3d")
+	txt_flname = str(tmp_path / "quad.txt")
+	write_ms3d_bin_file(bin_flname, msf)
+	write_ms3d_txt_file(txt_flname, msf)
+	(meshes, materials) = ms3d_import.read_ms3d_txt_meshes(txt_flname, workers=workers)
+	assert len(meshes) == 2
+	results = ms3d_import.read_ms3d_files([bin_flname], workers=workers)
+	assert results[0].error == None
+	assert len(results[0].load().triangles) == 2
+
+
+def test_pool_with_a_given_start_method():
+	## spawn is there on every platform, the state is pickled to the workers
+	context = multiprocessing.get_context("spawn")
+	msf = two_group_file()
+	serial = MeshHelper()
+	serial.get(msf)
+	msh = MeshHelper()
+	msh.get(msf, workers=2, mp_context=context)
+	assert [(m.vertices, m.normals, m.trianglefaces) for m in msh.meshes] == [(m.vertices, m.normals, m.trianglefaces) for m in serial.meshes]
+	cf_serial = MS3DColumnFile()
+	serial.set_columns(cf_serial)
+	cf = MS3DColumnFile()
+	msh.set_columns(cf, workers=2, mp_context=context)
+	assert (cf.positions, cf.indices, cf.normals, cf.uvs) == (cf_serial.positions, cf_serial.indices, cf_serial.normals, cf_serial.uvs)